@@ -0,0 +1,184 @@
+"""Benchmarks of the hot paths of DataManager and LayoutBuilder on synthetic
+data of a given scale.
+
+Wall times and peak memory are appended to a JSON history and compared
+against a stored baseline, e.g.
+
+    python -m benchmarks.run --customers 200 --products 500 --years 5
+    python -m benchmarks.run --save-baseline
+"""
+import argparse
+import datetime
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from os.path import join
+
+import dash
+
+from benchmarks.synthetic import encode_upload, write_dataset
+from utils.data_gen import DataManager
+from utils.layout import LayoutBuilder
+
+here = pathlib.Path(__file__).parent.resolve()
+
+
+def measure(func, setup=None, repeat=5):
+    """Best wall time over the repetitions and peak memory of a call.
+
+    :param func: callable without arguments
+    :param setup: callable run before each call, not measured
+    :return: dict of seconds and peak_mb
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    # tracing slows down the call, hence a separate run
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return dict(seconds=min(times), peak_mb=peak / 2 ** 20)
+
+
+def run_benchmarks(data_path, repeat=5):
+    """Time the hot paths on the dataset in data_path
+
+    :return: dict of the measurements by benchmark name
+    """
+    dm = DataManager(data_path=data_path)
+    lb = LayoutBuilder(dash.Dash(__name__), dm)
+    customers = dm.unique_customers[:2]
+    customer, product = dm.customers[0], dm.products[0]
+    month = str(dm.today)
+    forms = dm.unique_forms
+    upload = encode_upload(sorted(pathlib.Path(data_path)
+                                  .glob('bestellungen_*.csv'))[-1])
+    amounts = iter(range(10 ** 9))
+
+    def cold():
+        """Forget all cached results and order views"""
+        dm.cache.clear()
+        dm._drop_aggregates()
+
+    benchmarks = {
+        'DataManager.__init__':
+            (lambda: DataManager(data_path=data_path), None),
+        'calculate_additional_features':
+            (dm.calculate_additional_features, None),
+        # alternating amounts, such that the data does not drift
+        'update_orders':
+            (lambda: dm.update_orders([customer], [product], month,
+                                      (-1) ** next(amounts)), None),
+        'parse_upload':
+            (lambda: dm.parse_upload(upload, 'bestellungen.csv', None),
+             None),
+        'orders_over_time':
+            (lambda: dm.orders_over_time(customers), cold),
+        'orders_over_time (warm)':
+            (lambda: dm.orders_over_time(customers), None),
+        'generate_order_table_content':
+            (lambda: lb.generate_order_table_content(page=1), cold),
+        'build_monitoring_tab':
+            (lb.build_monitoring_tab, cold),
+        'FormsPanelArtist.paint':
+            (lb.form_artist.paint, cold),
+        'FormsPanelArtist.get_panel_contents':
+            (lambda: lb.form_artist.get_panel_contents(forms), cold),
+    }
+    return {name: measure(func, setup, repeat)
+            for name, (func, setup) in benchmarks.items()}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Benchmarks slower or more memory-hungry than the baseline by more
+    than the tolerated fraction
+
+    :return: list of (benchmark, metric, baseline value, value)
+    """
+    regressions = []
+    for name, measured in results.items():
+        for metric, value in measured.items():
+            reference = baseline.get(name, {}).get(metric)
+            if reference is not None and value > reference * (1 + tolerance):
+                regressions.append((name, metric, reference, value))
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=here, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--customers', type=int, default=2)
+    parser.add_argument('--products', type=int, default=16)
+    parser.add_argument('--forms', type=int, default=18)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--history', default=join(here, 'history.json'))
+    parser.add_argument('--baseline', default=join(here, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='tolerated fraction of slow-down')
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore')
+
+    scale = dict(customers=args.customers, products=args.products,
+                 forms=args.forms, years=args.years)
+    with tempfile.TemporaryDirectory() as data_path:
+        write_dataset(data_path, args.customers, args.products, args.forms,
+                      args.years)
+        results = run_benchmarks(data_path, args.repeat)
+    for name, measured in results.items():
+        print(f'{name:40s} {measured["seconds"] * 1000:10.1f} ms '
+              f'{measured["peak_mb"]:10.1f} MB')
+
+    run = dict(time=datetime.datetime.now().isoformat(timespec='seconds'),
+               revision=_git_revision(), scale=scale, results=results)
+    history = []
+    if pathlib.Path(args.history).exists():
+        with open(args.history) as f:
+            history = json.load(f)
+    with open(args.history, 'w') as f:
+        json.dump(history + [run], f, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=1)
+        return 0
+    if not pathlib.Path(args.baseline).exists():
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['scale'] != scale:
+        print(f'Baseline of scale {baseline["scale"]} not comparable')
+        return 0
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for name, metric, reference, value in regressions:
+        print(f'Regression of {name}: {metric} {reference:.4g} -> '
+              f'{value:.4g}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import base64
+import pathlib
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+
+def write_dataset(path, n_customers=2, n_products=16, n_forms=18, n_years=2,
+                  last_year=None, seed=0):
+    """Write a synthetic dataset in the schemas of the CSVs in the data
+    folder, such that DataManager(data_path=path) loads it.
+
+    Each customer orders a random subset of the products with seasonal
+    monthly amounts, each product wears a few forms.
+
+    :param path: directory to write the CSVs to, created if missing
+    :param n_years: amount of years of orders, one file per year
+    :param last_year: year of the last order file. Next year if None, such
+    that the dataset has upcoming orders.
+    :return: list of the written file paths
+    """
+    rng = np.random.default_rng(seed)
+    pathlib.Path(path).mkdir(parents=True, exist_ok=True)
+    if last_year is None:
+        last_year = pd.Timestamp('today').year + 1
+    products = np.arange(55, 55 + n_products)
+    forms = [f'F{i + 1}' for i in range(n_forms)]
+    paths = []
+
+    forms_df = pd.DataFrame({
+        'Form': forms,
+        'Anzahl bisheriger Gießvorgänge': rng.integers(0, 15000, n_forms),
+        'Anzahl maximaler Gießvorgänge': 20000,
+        'Gießzellenbedarf': rng.uniform(0.5, 1.5, n_forms).round(1)})
+    paths.append(join(path, 'formen_und_giesszellenbedarf_2019.csv'))
+    forms_df.to_csv(paths[-1], index=False)
+
+    # each product wears about three forms
+    uses = rng.random((n_products, n_forms)) < min(3 / n_forms, 1)
+    uses[np.arange(n_products), rng.integers(0, n_forms, n_products)] = True
+    lut = pd.DataFrame(np.where(uses, rng.uniform(0.1, 3, uses.shape), 0)
+                       .round(1), columns=forms)
+    lut.insert(0, 'Produktnummer', products)
+    paths.append(join(path, 'zuweisung_produkte_und_formen.csv'))
+    lut.to_csv(paths[-1], index=False)
+
+    # customer-product pairs, each customer orders a third of the products
+    ordered = rng.random((n_customers, n_products)) < 1 / 3
+    ordered[np.arange(n_customers),
+            rng.integers(0, n_products, n_customers)] = True
+    customer_idx, product_idx = np.nonzero(ordered)
+    scale = rng.lognormal(4, 1, len(customer_idx))
+    for year in range(last_year - n_years + 1, last_year + 1):
+        months = pd.period_range(f'{year}-01', f'{year}-12', freq='M')
+        season = 1 + 0.5 * np.sin(np.arange(12) / 12 * 2 * np.pi)
+        amounts = rng.poisson(scale[:, np.newaxis] * season)
+        # many months without orders
+        amounts[rng.random(amounts.shape) < 0.3] = 0
+        df = pd.DataFrame(amounts, columns=months.strftime('%b-%y'))
+        df.insert(0, 'Produktnummer', products[product_idx])
+        df.insert(0, 'Kunde', customer_idx + 1)
+        df['Gesamt'] = amounts.sum(axis=1)
+        paths.append(join(path, f'bestellungen_{year}.csv'))
+        df.to_csv(paths[-1], index=False)
+    return paths
+
+
+def encode_upload(file_path):
+    """Content of a CSV file as given by the dash upload component"""
+    with open(file_path, 'rb') as f:
+        return 'data:text/csv;base64,' + base64.b64encode(f.read()).decode()
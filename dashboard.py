@@ -0,0 +1,387 @@
+import html as html_escape
+import os
+import pathlib
+import time
+import pandas as pd
+
+import dash
+import dash_html_components as html
+import flask
+from dash.dependencies import Input, Output, State
+
+from utils.data_gen import DataManager
+from utils.layout import LayoutBuilder
+from utils.profiling import CallbackProfiler
+from utils.metrics import MetricsRegistry, data_manager_collector, \
+    instrument_callbacks, instrument_methods
+from utils.scenario import Scenario
+
+
+app = dash.Dash(
+    __name__,
+    meta_tags=[{"name": "viewport",
+                "content": "width=device-width, initial-scale=1"}],
+)
+server = app.server
+app.config["suppress_callback_exceptions"] = True
+
+# data wrangling, changes are persisted in data/store
+data_path = pathlib.Path(__file__).parent.resolve() / 'data'
+dm = DataManager(store_path=str(data_path / 'store'),
+                 model_path=str(data_path / 'models'))
+lb = LayoutBuilder(app, dm)  # layout specifications
+
+# telemetry of this worker, served at /metrics
+metrics = MetricsRegistry()
+instrument_methods(dm, ['sync', 'order_aggregate', 'query_orders',
+                        'update_orders', 'parse_uploads',
+                        'calculate_additional_features', 'maintenance_plan',
+                        'capacity_plan', 'evaluate_scenario'],
+                   metrics, 'data_manager_seconds')
+metrics.add_collector(data_manager_collector(dm))
+
+# main structure
+app.layout = lb.build_main_structure()
+
+
+@server.before_request
+def sync_shared_state():
+    """Apply the order changes of other workers before serving a request"""
+    dm.sync()
+
+
+# Callback functions
+@app.callback(
+    Output("app-content", "children"),
+    [Input("app-tabs", "value")],
+    [State("ai-store", "data")])
+def render_tab_content(tab_switch, ai_on):
+    tab_funcs = {'tab1': lb.build_upload_data_tab,
+                 'tab2': lambda: lb.build_monitoring_tab(bool(ai_on)),
+                 'tab3': lb.build_ml_tab,
+                 'tab4': lb.build_scenario_tab}
+    chosen_tab_func = tab_funcs.get(tab_switch, None)
+    if chosen_tab_func is None:
+        raise ValueError()
+    else:
+        return chosen_tab_func()
+
+
+# ======= Callbacks for demand forecasts =======
+@app.callback(
+    Output("ai-store", "data"),
+    [Input("AI-powerbutton", "on")])
+def switch_ai(on):
+    """Forecasts are included in the dashboard while the AI switch is on"""
+    if on and dm.demand_model is None:
+        dm.train_demand_models()
+    return bool(on)
+
+
+@app.callback(
+    Output("ml-status", "children"),
+    [Input("retrain-btn", "n_clicks")])
+def retrain_demand_models(n_clicks):
+    # the models are trained on first use, not by every worker at start
+    if n_clicks or dm.demand_model is None:
+        dm.train_demand_models()
+    return lb.describe_demand_models()
+
+
+# ======= Callbacks for ABOUT popup =======
+@app.callback(
+    Output("markdown", "style"),
+    [Input("about-button", "n_clicks"),
+     Input("markdown_close", "n_clicks")],
+)
+def update_click_output(button_click, close_click):
+    ctx = dash.callback_context
+    if ctx.triggered:
+        prop_id = ctx.triggered[0]["prop_id"].split(".")[0]
+        if prop_id == "about-button":
+            return {"display": "block"}
+    return {"display": "none"}
+
+
+# ======= Callbacks for Data Upload Tab =======
+@app.callback(
+    [Output("orders-table-content", 'children'),
+     Output("orders-table-page", 'data'),
+     Output("orders-table-page-label", 'children'),
+     Output("upload-job", 'data')],
+    [Input("value-setter-set-btn", 'n_clicks'),
+     Input("metric-select-dropdown-customer", 'value'),
+     Input("metric-select-dropdown-product", 'value'),
+     Input("date-picker-single", 'date'),
+     Input('drag-n-drop', 'contents'),
+     Input("orders-table-sort", 'value'),
+     Input("orders-table-sort-direction", 'value'),
+     Input("orders-table-prev-btn", 'n_clicks'),
+     Input("orders-table-next-btn", 'n_clicks'),
+     Input("upload-done", 'data')],
+    [State('abrufmenge-input', 'value'),
+     State('drag-n-drop', 'filename'),
+     State('drag-n-drop', 'last_modified'),
+     State("orders-table-page", 'data')]
+)
+def update_orders(n_clicks, customers, products, date, dragged_content,
+                  sort_by, sort_direction, prev_clicks, next_clicks,
+                  upload_done, amt, dragged_filename, dragged_last_mod, page):
+    """Callback function for the display of current dataset. Only the
+    currently viewed page of the table is sent to the browser. Uploads are
+    ingested by a background job, the table is refreshed once it is done."""
+
+    def a_selection_is_given(selection):
+        is_given = False
+        if selection is not None:
+            if not isinstance(selection, list):
+                selection = [selection]
+            if len(selection) > 0:
+                is_given = True
+        return is_given
+
+    date = pd.Period(date, freq='M')
+    ctx = dash.callback_context
+    page = page or 0
+    upload_job = dash.no_update
+
+    # what has triggered this callback function?
+    if ctx.triggered:
+        prop_id, prop_type = ctx.triggered[0]['prop_id'].split('.')
+        if prop_id == 'orders-table-prev-btn':
+            page -= 1
+        elif prop_id == 'orders-table-next-btn':
+            page += 1
+        else:
+            # the filtered or sorted table starts over on its first page
+            page = 0
+        if prop_id == 'value-setter-set-btn':
+            if n_clicks > 0:
+                customers_given = a_selection_is_given(customers)
+                products_given = a_selection_is_given(products)
+                # month is always given due to date picker component
+                if customers_given and products_given:
+                    dm.update_orders(customers, products, date, amt)
+                else:
+                    return html.Div('Please specify at least one customer '
+                                    'and one product!'), page, '', upload_job
+        elif prop_id == 'drag-n-drop':
+            if dragged_content is not None:
+                if not isinstance(dragged_content, list):
+                    dragged_content = [dragged_content]
+                    dragged_filename = [dragged_filename]
+                upload_job = dm.jobs.submit('Upload', dm.parse_uploads,
+                                            dragged_content, dragged_filename)
+    return lb.generate_order_table_content(customers, products, date,
+                                           sort_by, sort_direction == 'asc',
+                                           page) + (upload_job,)
+
+
+@app.callback(
+    [Output("upload-progress", 'children'),
+     Output("job-poll", 'disabled'),
+     Output("upload-done", 'data')],
+    [Input("job-poll", 'n_intervals'),
+     Input("upload-job", 'data')])
+def poll_upload_job(n_intervals, job_id):
+    """Show the progress of the upload job, polled while it is running. The
+    job may run on another worker, its status is read from the job table."""
+    if job_id is None:
+        return '', True, dash.no_update
+    text, finished = lb.describe_job(job_id)
+    return text, finished, job_id if finished else dash.no_update
+
+
+lb.generate_form_panel_callbacks()  # dynamically generated callback funcs
+
+
+@app.callback(
+    Output("next_maintenances", "children"),
+    [Input("app-tabs", "value")])
+def update_maintenance_windows(_):
+    return lb.build_maintenance_windows()
+
+
+#  ======= middle panel (orders) ============
+# todo: this callback should work on textfield filters instead of app-tabs.value
+@app.callback(
+    output=Output("order-overview", "figure"),
+    inputs=[Input("app-tabs", "value"),
+            Input("AI-powerbutton", "on")],
+    state=[State("value-setter-store", "data"),
+           State("order-overview", "figure")],
+)
+def update_order_chart(_, ai_on, data, cur_fig):
+    return lb.update_order_chart(lb.chart_customers, bool(ai_on))
+
+
+@app.callback(
+    output=Output("order-piechart", "figure"),
+    inputs=[Input("app-tabs", "value"),
+            Input("AI-powerbutton", "on")],
+    state=[State("value-setter-store", "data")],
+)
+def update_order_piechart(_, ai_on, stored_data):
+    return lb.update_order_pie(lb.chart_customers, bool(ai_on))
+
+
+#  ======= bottom panel (giesszellenbedarf) ============
+@app.callback(
+    output=Output("giess-overview", "figure"),
+    inputs=[Input("app-tabs", "value"),
+            Input("AI-powerbutton", "on")],
+    state=[State("value-setter-store", "data")],
+)
+def update_giess_chart(_, ai_on, stored_data):
+    return lb.update_giess_chart(lb.chart_customers, bool(ai_on))
+
+
+@app.callback(
+    output=Output("giess-piechart", "figure"),
+    inputs=[Input("app-tabs", "value"),
+            Input("AI-powerbutton", "on")],
+    state=[State("value-setter-store", "data")],
+)
+def update_giess_piechart(_, ai_on, stored_data):
+    return lb.update_giess_pie(lb.chart_customers, bool(ai_on))
+
+
+#  ======= capacity planning ============
+@app.callback(
+    output=[Output("capacity-chart", "figure"),
+            Output("capacity-status", "children"),
+            Output("capacity-poll", "disabled")],
+    inputs=[Input("capacity-input", "value"),
+            Input("capacity-poll", "n_intervals")],
+)
+def update_capacity_plan(capacity, _):
+    """The plan is computed in the background, poll until it is done"""
+    plan, job_id = dm.capacity_plan(capacity)
+    if plan is None:
+        text, finished = lb.describe_job(job_id)
+        return dash.no_update, text, finished
+    return lb.update_capacity_chart(plan), lb.describe_capacity_plan(plan), \
+        True
+
+
+#  ======= what-if scenarios ============
+@app.callback(
+    Output("scenario-store", "data"),
+    [Input("scenario-add-btn", "n_clicks"),
+     Input("scenario-clear-btn", "n_clicks")],
+    [State("scenario-store", "data"),
+     State("scenario-name", "value"),
+     State("scenario-customers", "value"),
+     State("scenario-products", "value"),
+     State("scenario-months", "start_date"),
+     State("scenario-months", "end_date"),
+     State("scenario-factor", "value"),
+     State("scenario-amt", "value")])
+def edit_scenarios(add_click, clear_click, stored, name, customers, products,
+                   start_date, end_date, factor, amt):
+    """Adds a change to the named scenario, creating it if needed. The
+    scenarios live in the browser, such that any worker can evaluate them."""
+    ctx = dash.callback_context
+    if not ctx.triggered:
+        return dash.no_update
+    prop_id = ctx.triggered[0]["prop_id"].split(".")[0]
+    if prop_id == "scenario-clear-btn":
+        return []
+    if not name or not start_date or not end_date:
+        return dash.no_update
+    # a cleared input means no change, not zero orders
+    factor = 100 if factor is None else factor
+    scenarios = [Scenario.from_json(data) for data in stored or []]
+    names = [scenario.name for scenario in scenarios]
+    if name not in names:
+        scenarios.append(Scenario(name))
+        names.append(name)
+    position = names.index(name)
+    scenarios[position] = scenarios[position].add(
+        customers, products, pd.Period(start_date, freq='M'),
+        pd.Period(end_date, freq='M'), factor / 100, amt or 0)
+    return [scenario.to_json() for scenario in scenarios]
+
+
+@app.callback(
+    [Output("scenario-list", "children"),
+     Output("scenario-giess-chart", "figure"),
+     Output("scenario-eol-table", "children")],
+    [Input("scenario-store", "data")])
+def compare_scenarios(stored):
+    scenarios = [Scenario.from_json(data) for data in stored or []]
+    base = dm.evaluate_scenario(Scenario('Aktuell'))
+    results = {scenario.name: dm.evaluate_scenario(scenario)
+               for scenario in scenarios}
+    return lb.describe_scenarios(scenarios), \
+        lb.update_scenario_chart(base, results), \
+        lb.build_scenario_eol_table(base, results)
+
+
+#  ======= quick stats ============
+@app.callback(
+    output=Output("attrition-gauge", "value"),
+    inputs=[Input("app-tabs", "value"),
+            Input("AI-powerbutton", "on")],
+)
+def update_auslastung(_, ai_on):
+    return lb.update_auslastung(bool(ai_on))
+
+
+# all callbacks are registered by now
+instrument_callbacks(app, metrics)
+# profiles of all callbacks with SPC_PROFILE=all, of pages opened with the
+#  query flag ?profile with SPC_PROFILE=query, browsable at /profiles.
+#  Without SPC_PROFILE nothing is profiled and /profiles does not exist.
+profile_mode = os.environ.get('SPC_PROFILE')
+if profile_mode not in (None, '', 'query', 'all'):
+    raise ValueError(f'SPC_PROFILE must be query or all, not {profile_mode}')
+profiler = CallbackProfiler(data_path / 'profiles',
+                            always=profile_mode == 'all') \
+    if profile_mode else None
+
+
+@server.route('/metrics')
+def serve_metrics():
+    """Metrics of this worker in the Prometheus text format"""
+    return flask.Response(metrics.render(),
+                          mimetype='text/plain; version=0.0.4')
+
+
+def serve_profile_report():
+    """The slowest profiled callbacks"""
+    rows = []
+    for p in profiler.slowest(profiler.report_top_n):
+        started = time.strftime('%Y-%m-%d %H:%M:%S',
+                                time.localtime(p['started']))
+        links = ' '.join(f'<a href="/profiles/{p["name"]}{suffix}">{label}</a>'
+                         for suffix, label in [('/stats', 'Statistik'),
+                                               ('.prof', '.prof'),
+                                               ('.collapsed', '.collapsed')])
+        rows.append(f'<tr><td>{html_escape.escape(p["callback"])}</td>'
+                    f'<td>{p["seconds"] * 1000:.1f} ms</td>'
+                    f'<td>{started}</td><td>{links}</td></tr>')
+    return '<table><tr><th>Callback</th><th>Dauer</th><th>Zeitpunkt</th>' \
+           f'<th>Profil</th></tr>{"".join(rows)}</table>'
+
+
+def serve_profile_stats(name):
+    if profiler.file(f'{name}.prof') is None:
+        flask.abort(404)
+    return flask.Response(profiler.stats(name), mimetype='text/plain')
+
+
+def serve_profile(filename):
+    path = profiler.file(filename)
+    if path is None:
+        flask.abort(404)
+    return flask.send_file(path, as_attachment=True)
+
+
+if profiler is not None:
+    profiler.instrument(app)
+    server.add_url_rule('/profiles', view_func=serve_profile_report)
+    server.add_url_rule('/profiles/<name>/stats',
+                        view_func=serve_profile_stats)
+    server.add_url_rule('/profiles/<filename>', view_func=serve_profile)
+
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from benchmarks.synthetic import encode_upload, write_dataset
+from utils.data_gen import DataManager
+
+
+def upload_next_year(tmp_path):
+    """DataManager of a synthetic dataset and the upload of the orders of
+    the year after it, which only adds new months"""
+    year = pd.Timestamp('today').year + 1
+    write_dataset(tmp_path / 'data', last_year=year)
+    (path,) = [p for p in write_dataset(tmp_path / 'upload',
+                                        last_year=year + 1, n_years=1)
+               if 'bestellungen' in p]
+    return DataManager(data_path=str(tmp_path / 'data')), \
+        encode_upload(path)
+
+
+def test_upload_report_does_not_depend_on_chunk_size(tmp_path):
+    reports = []
+    for chunksize in (20000, 3):
+        dm, upload = upload_next_year(tmp_path)
+        dm.upload_chunksize = chunksize
+        reports.append(dm.parse_uploads([upload], ['bestellungen.csv']))
+    assert reports[0] == reports[1]
+    assert reports[0].updated == 0 and reports[0].inserted > 0
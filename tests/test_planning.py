@@ -0,0 +1,10 @@
+import numpy as np
+
+from utils.planning import _fill
+
+
+def test_fill_exactly_filled_capacity_casts_nothing_more():
+    # 3 * 0.1 exceeds 0.3 by rounding, but fills the capacity
+    cast = _fill(np.array([3., 5.]), np.array([.1, 1.]), .3,
+                 np.array([0, 1]))
+    assert cast.tolist() == [3., 0.]
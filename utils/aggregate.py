@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+
+class OrderAggregate:
+    """Materialized view of the upcoming orders of a customer set, summed
+    over the customers, and of the casting cell demand they cause.
+
+    All charts and quick stats of a customer set read from the same view
+    instead of pivoting the order cube on their own. Changed order cells
+    are applied as deltas, such that the view does not have to be rebuilt
+    from the order cube after every mutation. Views are immutable, updates
+    return a new view, such that readers never see a half-updated one.
+    """
+
+    def __init__(self, customer_positions, orders, months, products,
+                 giess_per_product, start=None):
+        """
+        :param customer_positions: positions of the customer set on the
+        customer axis of the order cube
+        :param orders: month x product array of the upcoming orders
+        :param months: pd.PeriodIndex of the upcoming months
+        :param products: pd.Index of the products
+        :param giess_per_product: casting cell demand of an order per product
+        :param start: position of the first upcoming month on the month
+        axis of the order cube. None if the orders are complemented by the
+        demand forecast, as such views cannot be updated by deltas.
+        """
+        self.customer_positions = np.asarray(customer_positions)
+        self.months, self.products = months, products
+        self.start = start
+        self.versions = None  # data versions the view reflects
+        self.orders = orders
+        self.giess_per_product = np.asarray(giess_per_product)
+        self._derive()
+
+    def _derive(self):
+        self.giess = self.orders * self.giess_per_product
+        self.order_totals = self.orders.sum(axis=0)
+        self.giess_totals = self.giess.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # normalized to the largest share as shown by the pie charts
+            self.order_shares = self.order_totals / self.order_totals.max()
+            self.giess_shares = self.giess_totals / self.giess_totals.max()
+
+    @property
+    def orders_frame(self):
+        """Upcoming orders as pd.DataFrame of months x products"""
+        return pd.DataFrame(self.orders, index=self.months,
+                            columns=self.products)
+
+    @property
+    def giess_frame(self):
+        """Upcoming casting cell demand as pd.DataFrame of months x
+        products"""
+        return pd.DataFrame(self.giess, index=self.months,
+                            columns=self.products)
+
+    def giess_in(self, month):
+        """Casting cell demand per product in the given month, zero if the
+        month is not covered"""
+        position = self.months.get_indexer([month])[0]
+        if position < 0:
+            return np.zeros(len(self.products))
+        return self.giess[position]
+
+    def apply(self, customer_idx, product_idx, month_idx, delta):
+        """View with changed order cells of the order cube applied.
+
+        :param customer_idx: positions on the customer axis
+        :param product_idx: positions on the product axis
+        :param month_idx: positions on the month axis of the order cube
+        :param delta: order deltas aligned with the positions
+        :return: OrderAggregate
+        """
+        if self.start is None:
+            raise ValueError('Views including the forecast are rebuilt '
+                             'instead of updated')
+        month_idx = month_idx - self.start
+        mine = np.isin(customer_idx, self.customer_positions) & \
+            (month_idx >= 0) & (delta != 0)
+        if not mine.any():
+            return self
+        orders = self.orders.copy()
+        np.add.at(orders, (month_idx[mine], product_idx[mine]), delta[mine])
+        return OrderAggregate(self.customer_positions, orders, self.months,
+                              self.products, self.giess_per_product,
+                              self.start)
+
+    def reweight(self, giess_per_product):
+        """View with the casting cell demand of changed forms"""
+        return OrderAggregate(self.customer_positions, self.orders,
+                              self.months, self.products, giess_per_product,
+                              self.start)
+
+    @property
+    def updatable(self):
+        return self.start is not None
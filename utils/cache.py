@@ -0,0 +1,121 @@
+import functools
+import inspect
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+
+class ResultCache:
+    """Bounded LRU cache for query results and figures.
+
+    Keys are expected to carry the data versions the result was computed
+    from, so entries of outdated data are never hit again and simply age out
+    of the cache.
+
+    The cache is shared by the callback threads and background jobs. Its
+    entries are looked up and stored under a lock, results are computed
+    outside of it."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self.recomputes = Counter()  # computations by cached function
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, func):
+        """Return the cached result for key or compute, store and return it.
+
+        :param key: hashable cache key
+        :param func: callable without arguments producing the result
+        """
+        missing = object()
+        result = self.get(key, missing)
+        if result is missing:
+            # concurrent misses of a key may compute it twice, the last one
+            #  is kept
+            result = func()
+            self._store(key, result)
+        return result
+
+    def get(self, key, default=None):
+        """Cached result for key or default, without computing it"""
+        with self.lock:
+            try:
+                result = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        """Store a result computed elsewhere, e.g. by a background job"""
+        self._store(key, result)
+
+    def _store(self, key, result):
+        with self.lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        """Hit/miss counters for tuning the cache size"""
+        with self.lock:
+            hits, misses = self.hits, self.misses
+            evictions, size = self.evictions, len(self._entries)
+        requests = hits + misses
+        return dict(hits=hits, misses=misses, evictions=evictions,
+                    size=size, maxsize=self.maxsize,
+                    hit_rate=hits / requests if requests > 0 else 0.)
+
+
+def _normalize(value):
+    """Make filter arguments hashable and order-independent, e.g. the
+    customer selections [2, 1], (1, 2) and {1, 2} all map onto (1, 2)."""
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray)):
+        return tuple(sorted({_normalize(v) for v in value}, key=str))
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def cached(*depends_on):
+    """Decorator caching the results of DataManager methods, or of methods of
+    objects holding a DataManager as `dm`, in the DataManager's result cache.
+
+    :param depends_on: names of the data versions in DataManager.versions
+    the result depends on, e.g. 'orders' or 'forms'
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            dm = getattr(self, 'dm', self)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = tuple((name, _normalize(value)) for name, value in
+                              list(bound.arguments.items())[1:])
+            key = (func.__qualname__, dm.today,
+                   tuple(dm.versions[d] for d in depends_on), arguments)
+
+            def compute():
+                with dm.cache.lock:
+                    dm.cache.recomputes[func.__qualname__] += 1
+                return func(self, *args, **kwargs)
+            return dm.cache.get_or_compute(key, compute)
+        return wrapper
+    return decorator
@@ -1,36 +1,128 @@
-import base64
-import io
+import glob
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
 import pathlib
 from os.path import join
 
+from utils.aggregate import OrderAggregate
+from utils.cache import ResultCache, cached
+from utils.forecast import order_variability, form_attrition_moments, \
+    forecast_eol, eol_quantiles
+from utils.demand import DemandForecaster
+from utils.jobs import JobRunner
+from utils.maintenance import plan_maintenance_windows
+from utils.planning import maintenance_downtime, plan_production, \
+    product_availability
+from utils.scenario import overlay_cells
+from utils.store import SnapshotStore
+from utils.upload import read_order_chunks
+
+
+IngestReport = namedtuple('IngestReport', ['inserted', 'updated', 'clamped'])
+ProductionPlan = namedtuple('ProductionPlan', ['schedule', 'late', 'unmet',
+                                               'load', 'late_load', 'demand',
+                                               'capacity', 'downtime'])
+ScenarioResult = namedtuple('ScenarioResult', ['orders', 'giess',
+                                               'form_attrition',
+                                               'next_maintenance',
+                                               'changed_cells'])
+
 
 class DataManager:
     """Data wrangler class"""
-    time_format = '%b %y'
+    order_table_columns = ['Kunde', 'Produkt', 'date', 'Bestellmenge']
+    cache_size = 256  # max. amount of cached query results and figures
+    max_logged_records = 10000  # larger ingestions trigger a new snapshot
+    upload_chunksize = 20000  # rows of an uploaded file parsed at once
+    # forms due within these months are critical (0) or near critical (1),
+    #  all others are uncritical (2)
+    criticality_months = (3, 6)
+    # EOL quantile the criticality is based on, e.g. 0.1 for the pessimistic
+    #  P10 of the Monte Carlo forecast. None uses the deterministic EOL
+    criticality_quantile = None
+    eol_paths = 10000  # simulated order trajectories of the EOL forecast
+    eol_jobs = 1  # worker processes of the EOL forecast
+    forecast_months = 12  # horizon of the demand forecast from today on
+    max_aggregates = 32  # materialized order views of customer sets
+    casting_cell_capacity = 650000  # casting cell demand castable per month
+    maintenance_months = 1  # months a form is down for maintenance at EOL
+    maintenance_crew_capacity = 4  # forms the crew maintains per window
 
-    def __init__(self):
+    def __init__(self, store_path=None, model_path=None, data_path=None):
         """Loads data from data folder. So far this is the only place where
-        new customers, products and forms could get into the app."""
-        
-        data_path = join(str(pathlib.Path(__file__).parent.resolve()),
-                         '..', 'data')
+        new customers, products and forms could get into the app.
+
+        :param store_path: directory of a SnapshotStore. If given, all
+        changes are persisted there and the latest snapshot is loaded
+        instead of the data folder on start.
+        :param model_path: directory the fitted demand models are cached in
+        :param data_path: data folder, the repo's data folder if None
+        """
+        self.data_path = data_path or \
+            join(str(pathlib.Path(__file__).parent.resolve()), '..', 'data')
+        # data versions, bumped by every mutation of the respective data
+        #  'orders': order cube and everything derived from it
+        #  'forms': forms, their attrition counts and product assignments
+        #  'forecast': the demand model
+        self.versions = dict(orders=0, forms=0, forecast=0)
+        self.cache = ResultCache(self.cache_size)
+
+        #  pre-declare to comfy with PEP
+        self.prod_form_map, self.prod_giesszellenbedarf_map, \
+        self.attrition_per_product = None, None, None
+        self._form_attrition = None  # month x form
+        # order views by (customer positions, forecast), see order_aggregate
+        self._aggregates = OrderedDict()
+        # changed order cells not yet applied to the order views
+        self._order_deltas = []
+        self._replaying = False  # whether the change log is being replayed
+        # serializes mutations of concurrent callbacks within this worker
+        self.lock = threading.RLock()
+        self.seq = 0  # sequence number of the last applied logged change
+        self.forecaster = DemandForecaster(model_path)
+        self.demand_model = None
+        # background jobs, shared job table in the store's directory
+        self.jobs = JobRunner(path=store_path)
+        self._training = None  # job id of the demand model training
+        self._planning = {}  # job ids of capacity plannings by cache key
+
+        if store_path is None:
+            self.store = None
+            self._load_data_folder()
+            # calculate additional features
+            self.calculate_additional_features()
+            return
+        store = SnapshotStore(store_path)
+        with self.lock, store.transaction():
+            if store.has_snapshot():
+                self.store = store
+                self._sync()
+            else:
+                # first worker ever, initialize the store
+                self.store = None  # nothing to log while loading
+                self._load_data_folder()
+                self.calculate_additional_features()
+                self.store = store
+                self.compact()
+
+    def _load_data_folder(self):
+        """Loads forms, products and orders from the CSVs in data folder.
+        Orders are read from all files bestellungen_<year>.csv."""
+        data_path = self.data_path
         self.bedarf_formen = pd.read_csv(
             join(data_path, 'formen_und_giesszellenbedarf_2019.csv'))
 
         prod_form_lut = pd.read_csv(
             join(data_path, 'zuweisung_produkte_und_formen.csv'),
             dtype=dict(Produktnummer=np.uint32))
-        bestellungen_2019 = \
-            pd.read_csv(join(data_path, 'bestellungen_2019.csv')).dropna() \
-                .reset_index(drop=True).astype(np.uint32)
-        bestellungen_2020 = pd.read_csv(join(data_path,
-                                             'bestellungen_2020.csv')).dropna() \
-            .reset_index(drop=True).astype(np.uint32)
-
-        self.orders_df = pd.concat([self._prettify_orders(bestellungen_2019),
-                                    self._prettify_orders(bestellungen_2020)])
+        bestellungen = [
+            pd.read_csv(path).dropna().reset_index(drop=True)
+            .astype(np.uint32) for path in
+            sorted(glob.glob(join(data_path, 'bestellungen_*.csv')))]
+
         prod = prod_form_lut.pop('Produktnummer')
         stacked_lut = (prod_form_lut
                        .stack()
@@ -42,12 +134,114 @@ class DataManager:
                                   .reset_index(drop=True)
                                   .loc[:, ['Produktnummer', 'Form', 'Bedarf']])
 
-        # calculate additional features
-        #  pre-declare to comfy with PEP
-        self.prod_form_map, self.prod_giesszellenbedarf_map, \
-        self.form_attritions_over_time, self.cache = None, None, None, None
+        # dense order cube: customer x product x month
+        #  the axes' labels serve as index maps into the cube
+        self.customers = pd.Index([], dtype=np.uint32, name='Kunde')
+        self.products = pd.Index(np.sort(prod.unique()), dtype=np.uint32,
+                                 name='Produktnummer')
+        self.months = pd.PeriodIndex([], freq='M', name='date')
+        self.orders = np.zeros((0, len(self.products), 0), dtype=np.uint32)
+        for bestellungen_year in bestellungen:
+            self.ingest_orders(self._melt_orders(bestellungen_year),
+                               mode='set')
 
-        self.calculate_additional_features()
+    def _load_snapshot(self, name):
+        """Restores the state from a snapshot of the store. The order cube
+        and form attritions are memory-mapped, such that start-up time does
+        not grow with the order history."""
+        arrays, frames = self.store.load_snapshot(name)
+        self.bedarf_formen = frames['bedarf_formen']
+        self.forms_per_prod_df = frames['forms_per_prod_df'].astype(
+            dict(Produktnummer=np.uint32))
+        self.customers = pd.Index(arrays['customers'], name='Kunde')
+        self.products = pd.Index(arrays['products'], name='Produktnummer')
+        self.months = pd.PeriodIndex.from_ordinals(arrays['months'],
+                                                   freq='M').rename('date')
+        self.orders = arrays['orders']
+        self._drop_aggregates()
+        if not self.customers.is_monotonic_increasing:
+            # snapshots of older versions kept customers in insertion order
+            order = np.argsort(self.customers.values, kind='stable')
+            self.customers = self.customers[order]
+            self.orders = np.asarray(self.orders)[order]
+        self._form_attrition = arrays['form_attrition']
+        self._calculate_product_maps()
+        self._update_next_maintenance()
+        self._touch('orders', 'forms')
+
+    def sync(self):
+        """Apply the changes other workers logged to the shared store. This
+        is cheap if there are none."""
+        if self.store is None:
+            return
+        # a running mutation, e.g. an upload job, syncs on its own
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self.store.has_news():
+                self._sync()
+        finally:
+            self.lock.release()
+
+    def _sync(self):
+        """Catch up with the store's change log. Starts over from the latest
+        snapshot if one was taken since the last sync."""
+        changes = self.store.changes_since(self.seq)
+        snapshots = [i for i, (_, change) in enumerate(changes)
+                     if change['op'] == 'snapshot']
+        if len(snapshots) > 0:
+            seq, change = changes[snapshots[-1]]
+            self._load_snapshot(change['name'])
+            self.seq = seq
+            changes = changes[snapshots[-1] + 1:]
+        self._replaying = True
+        try:
+            for seq, change in changes:
+                if change['op'] == 'update':
+                    self.update_orders(change['customers'],
+                                       change['products'], change['date'],
+                                       change['amt'])
+                elif change['op'] == 'ingest':
+                    self.ingest_orders(change['records'], change['mode'])
+                self.seq = seq
+        finally:
+            self._replaying = False
+
+    @contextmanager
+    def _mutation(self):
+        """Context of every mutation. Mutations are serialized among the
+        threads of this worker and, with a store, among all workers, which
+        see a mutation only after the changes of the others were applied."""
+        with self.lock:
+            if self.store is None or self._replaying:
+                yield
+            else:
+                with self.store.transaction():
+                    self._sync()
+                    yield
+
+    def _log_change(self, change):
+        """Append a change to the store's change log, compacting the store
+        into a new snapshot if the log got too long"""
+        if self.store is None or self._replaying:
+            return
+        self.seq = self.store.append(change)
+        if self.store.needs_compaction():
+            self.compact()
+
+    def compact(self):
+        """Persist the current state as new snapshot of the store, which
+        also truncates the change log"""
+        with self.lock, self.store.transaction():
+            self.seq = self.store.save_snapshot(
+                arrays=dict(orders=self.orders,
+                            form_attrition=self._form_attrition,
+                            customers=self.customers.values,
+                            products=self.products.values,
+                            months=self.months.asi8),
+                frames=dict(bedarf_formen=self.bedarf_formen.drop(
+                    columns='next maintenance'),
+                            forms_per_prod_df=self.forms_per_prod_df))
 
     @property
     def unique_forms(self):
@@ -55,21 +249,22 @@ class DataManager:
 
     @property
     def unique_products(self):
-        return self.prod_form_map.index.tolist()
+        return self.products.tolist()
 
     @property
     def unique_customers(self):
-        return self.orders_df.Kunde.unique().tolist()
+        return self.customers.tolist()
 
     @property
     def today(self):
-        return pd.to_datetime('today').strftime(self.time_format)
+        return pd.Period(pd.to_datetime('today'), freq='M')
 
     @property
     def avg_attrition(self):
         return self.relative_attritions_per_form.mean()
 
     @property
+    @cached('forms')
     def relative_attritions_per_form(self):
         forms = self.bedarf_formen.set_index('Form')
         amt_max = forms['Anzahl maximaler Gießvorgänge']
@@ -77,189 +272,881 @@ class DataManager:
         return (amt_max - amt_act) / amt_max
 
     @property
-    def camera_ready_orders(self):
-        """Make table pretty for user view"""
-        return self.orders_df\
-                        .reset_index(drop=True).loc[:, ['Kunde',
-                                                        'Produktnummer',
-                                                        'date',
-                                                        'amt_orders']]\
-                        .rename(columns=dict(amt_orders='Bestellmenge',
-                                             Produktnummer='Produkt'))
+    def form_attritions_over_time(self):
+        """Form attritions per month as month x form frame"""
+        return pd.DataFrame(self._form_attrition, index=self.months,
+                            columns=self.unique_forms)
+
+    @cached('orders', 'forecast')
+    def upcoming_form_attritions(self, n_months=13, forecast=False):
+        """Form attritions of the next n_months from today on
+
+        :param forecast: whether planned orders are complemented by the
+        demand forecast, see _upcoming_orders
+        """
+        if not forecast:
+            start = self.months.searchsorted(self.today)
+            return self.form_attritions_over_time.iloc[start:start + n_months,
+                                                       :]
+        orders, months = self._upcoming_orders(np.arange(len(self.customers)),
+                                               forecast)
+        return pd.DataFrame(orders.sum(axis=0).T.dot(
+                                self.prod_form_map.values),
+                            index=months,
+                            columns=self.unique_forms).iloc[:n_months, :]
+
+    def query_orders(self, customers=None, products=None, month=None,
+                     sort_by='Kunde', ascending=True, page=0, page_size=50):
+        """Get one page of the user-view table of the order cube. Filtering,
+        sorting and paging happen on cube positions, such that only the
+        requested page is materialized.
+
+        :param customers: list of customers, no filter if None or empty
+        :param products: list of products, no filter if None or empty
+        :param month: pd.Period or anything convertible to it, no filter if
+        None
+        :param sort_by: one of order_table_columns. Ties are sorted by the
+        other key columns Kunde, Produkt and date
+        :param ascending: sort direction of sort_by
+        :param page: zero-based page number
+        :param page_size: max. amount of rows per page
+        :return: tuple (pd.DataFrame with columns order_table_columns,
+        total amount of rows matching the filter)
+        """
+        assert sort_by in self.order_table_columns, 'unknown sort column'
+        positions = [self._axis_positions(self.customers, customers),
+                     self._axis_positions(self.products, products),
+                     self._axis_positions(
+                         self.months,
+                         None if month is None else [pd.Period(month, 'M')])]
+        # positions along the sorted axes are ascending by label
+        shape = tuple(len(p) for p in positions)
+        n_rows = int(np.prod(shape))
+        start = min(page * page_size, n_rows)
+        stop = min(start + page_size, n_rows)
+
+        if sort_by == 'Bestellmenge':
+            amounts = self.orders[np.ix_(*positions)].ravel().astype(np.int64)
+            key = amounts if ascending else -amounts
+            if stop < n_rows:
+                # only the rows up to the requested page need to be sorted,
+                #  including all ties of the last one
+                last = np.partition(key, stop - 1)[stop - 1]
+                candidates = np.flatnonzero(key <= last)
+            else:
+                candidates = np.arange(n_rows)
+            rows = candidates[np.lexsort((candidates,
+                                          key[candidates]))][start:stop]
+            cube_idx = np.unravel_index(rows, shape)
+        else:
+            # the sort column becomes the slowest varying axis
+            first = self.order_table_columns.index(sort_by)
+            axis_order = [first] + [i for i in range(3) if i != first]
+            idx = np.unravel_index(np.arange(start, stop),
+                                   [shape[i] for i in axis_order])
+            cube_idx = [None] * 3
+            for i, ix in zip(axis_order, idx):
+                cube_idx[i] = ix
+            if not ascending:
+                cube_idx[first] = shape[first] - 1 - cube_idx[first]
+        cells = [p[ix] for p, ix in zip(positions, cube_idx)]
+        return self._to_order_table(self._cells_to_frame(*cells)), n_rows
+
+    @staticmethod
+    def _to_order_table(orders_df):
+        """Reduce a long-format orders frame to the user-view columns"""
+        return (orders_df
+                    .loc[:, ['Kunde', 'Produktnummer', 'date', 'amt_orders']]
+                    .rename(columns=dict(amt_orders='Bestellmenge',
+                                         Produktnummer='Produkt')))
+
+    @staticmethod
+    def _axis_positions(axis, keys):
+        """Translate keys into positions along a cube axis. Unknown keys are
+        ignored, None or an empty selection yields the full axis.
+
+        The cube axes are kept sorted and free of duplicates, i.e. they are
+        maintained indexes of the cube and a lookup is a binary search per
+        key instead of a scan. The positions are returned sorted, such that
+        multi-key filters are the intersections np.ix_(ci, pi, mi) of
+        label-ordered position arrays."""
+        if keys is None:
+            return np.arange(len(axis))
+        if not isinstance(keys, (list, tuple, np.ndarray, pd.Index)):
+            keys = [keys]
+        if len(keys) == 0:
+            return np.arange(len(axis))
+        if len(axis) == 0:
+            return np.arange(0)
+        keys = pd.Index(keys).astype(axis.dtype, copy=False)
+        positions = axis.searchsorted(keys).clip(max=len(axis) - 1)
+        return np.unique(positions[axis[positions] == keys])
+
+    def _cells_to_frame(self, ci, pi, mi):
+        """Build a long-format orders frame from cube positions"""
+        ci, pi, mi = ci.ravel(), pi.ravel(), mi.ravel()
+        amt_orders = self.orders[ci, pi, mi]
+        total_attrition = None
+        if self.attrition_per_product is not None:
+            total_attrition = \
+                amt_orders * self.attrition_per_product.values[pi]
+        return pd.DataFrame({'date': self.months[mi],
+                             'amt_orders': amt_orders,
+                             'Kunde': self.customers.values[ci],
+                             'Produktnummer': self.products.values[pi],
+                             'total_attrition': total_attrition},
+                            index=np.ravel_multi_index((ci, pi, mi),
+                                                       self.orders.shape))
 
     @staticmethod
-    def _prettify_orders(df):
-        """Reformat original orders dataset"""
-        df.drop('Gesamt', axis=1, inplace=True)
-        customer_x_prod = df.iloc[:, :2]
-        orders = df.iloc[:, 2:].stack().reset_index(1)
-        orders.columns = ['date', 'amt_orders']
-        orders = orders.join(customer_x_prod)
-        orders.date = pd.to_datetime(orders.date,
-                                     format='%b-%y').dt.strftime('%b %y')
-        return orders
+    def _melt_orders(df):
+        """Reformat an orders dataset from its original wide format (one row
+        per customer and product, one column per month) into order records
+        with columns Kunde, Produktnummer, date and amt"""
+        df = df.drop('Gesamt', axis=1, errors='ignore')
+        months = pd.PeriodIndex(pd.to_datetime(df.columns[2:],
+                                               format='%b-%y'), freq='M')
+        n_months = len(months)
+        return pd.DataFrame(
+            {'Kunde': np.repeat(df.Kunde.values, n_months),
+             'Produktnummer': np.repeat(df.Produktnummer.values, n_months),
+             'date': months[np.tile(np.arange(n_months), len(df))],
+             'amt': df.iloc[:, 2:].values.ravel()})
+
+    def _add_months(self, months):
+        """Extend the month axis of the order cube, keeping it sorted"""
+        months = pd.PeriodIndex(months, freq='M').unique()
+        months = months[~months.isin(self.months)]
+        if len(months) == 0:
+            return
+        all_months = self.months.append(months).sort_values().rename('date')
+        old_positions = all_months.get_indexer(self.months)
+        orders = np.zeros(self.orders.shape[:2] + (len(all_months),),
+                          dtype=self.orders.dtype)
+        orders[:, :, old_positions] = self.orders
+        form_attrition = self._form_attrition
+        if form_attrition is not None:
+            form_attrition = np.zeros((len(all_months),
+                                       self._form_attrition.shape[1]))
+            form_attrition[old_positions, :] = self._form_attrition
+        # the cubes and their axis are swapped at once, such that no reader
+        #  sees orders of the new shape along the old months
+        with self.lock:
+            self.orders, self._form_attrition, self.months = \
+                orders, form_attrition, all_months
+            self._drop_aggregates()
+            self._touch('orders')
+
+    def _add_customers(self, customers):
+        """Extend the customer axis of the order cube, keeping it sorted"""
+        customers = pd.Index(customers, dtype=np.uint32).unique()
+        customers = customers[~customers.isin(self.customers)]
+        if len(customers) == 0:
+            return
+        all_customers = self.customers.append(customers).sort_values() \
+            .rename('Kunde')
+        old_positions = all_customers.get_indexer(self.customers)
+        orders = np.zeros((len(all_customers),) + self.orders.shape[1:],
+                          dtype=self.orders.dtype)
+        orders[old_positions] = self.orders
+        with self.lock:
+            self.orders, self.customers = orders, all_customers
+            self._drop_aggregates()
+            self._touch('orders')
 
     def calculate_additional_features(self):
-        """Additional dataframes will be calculated on the base of orders_df,
-         unique_forms and forms_per_prod_df"""
+        """Additional arrays will be calculated on the base of the order
+        cube, unique_forms and forms_per_prod_df"""
+        self._calculate_product_maps()
+        # calculate form attritions over time
+        #  (month x product) . (product x form)
+        self._form_attrition = \
+            self.orders.sum(axis=0, dtype=np.int64).T.dot(
+                self.prod_form_map.values)
+
+        # calculate next maintenance dates for each form
+        self._update_next_maintenance()
+        self._touch('orders', 'forms')
 
-        attrition_by_product = \
-            self.orders_df.Produktnummer.map(
-                self.forms_per_prod_df[['Produktnummer', 'Bedarf']]
-                    .groupby('Produktnummer').sum().Bedarf.to_dict())
-        self.orders_df['total_attrition'] = \
-            self.orders_df.amt_orders * attrition_by_product
+    def _calculate_product_maps(self):
+        """Per-product attrition and product x form maps"""
+        self.attrition_per_product = (self.forms_per_prod_df[['Produktnummer',
+                                                              'Bedarf']]
+                                      .groupby('Produktnummer').sum().Bedarf
+                                      .reindex(self.products))
 
         unique_forms = self.unique_forms
         self.prod_form_map = \
             self.forms_per_prod_df.pivot(index='Produktnummer', columns='Form',
-                                         values='Bedarf')[unique_forms]
+                                         values='Bedarf')[unique_forms]\
+                .reindex(self.products)
         self.prod_giesszellenbedarf_map = self.prod_form_map * \
                                           self.bedarf_formen['Gießzellenbedarf'] \
                                               .values.T
         # prod_form_map.loc[56, 'F6']
-        orders_x_forms_df = self.orders_df.merge(
-            self.prod_form_map.reset_index(),
-            how='left', on='Produktnummer')
-        # calculate form attritions over time
 
-        orders_x_forms_df.loc[:, unique_forms] = \
-            orders_x_forms_df.loc[:, unique_forms] * \
-            orders_x_forms_df.amt_orders.values[:, np.newaxis]
-        self.form_attritions_over_time = (orders_x_forms_df
-                                          .groupby(['date'])[unique_forms]
-                                          .sum())
-        # sort by datetime_index
-        self.form_attritions_over_time = (self.form_attritions_over_time
-                                              .loc[pd.to_datetime(
-            self.form_attritions_over_time.index, format=self.time_format)
-                                              .sort_values()
-                                              .strftime(self.time_format), :])
+    def _touch(self, *data):
+        """Bump the versions of the given data after it was mutated, which
+        invalidates all cached results depending on it."""
+        for d in data:
+            self.versions[d] += 1
+        if 'orders' in data:
+            self._update_aggregates(self.versions['orders'] - 1)
 
-        # calculate next maintenance dates for each form
-        duration_left = self.bedarf_formen['Anzahl maximaler Gießvorgänge'] - \
-                        self.bedarf_formen['Anzahl bisheriger Gießvorgänge']
-        next_attritions = self.form_attritions_over_time.loc[self.today:,
-                          :].cumsum()
-        maintenance = (next_attritions - duration_left.values[np.newaxis,
-                                         :]) < 0
-        next_maintenance = maintenance.sum()
-        self.bedarf_formen['next maintenance'] = next_attritions.index[
-            next_maintenance.clip(upper=
-                                  len(maintenance) - 1)]
-        self.cache = {}
-
-    def maintenances_in_next_months(self, items_to_show=6):
-        """Get a list of next maintenances"""
-        next_maintenances = self.bedarf_formen['next maintenance']
-        dates = pd.to_datetime(next_maintenances, format=self.time_format)\
-                                .sort_values().iloc[:items_to_show]
-        forms = self.bedarf_formen.loc[dates.index, 'Form']
-        maintenances = [f'Form {form:>14}: {date:<10}' for form, date in
-                        zip(forms.tolist(),
-                            dates.dt.strftime(self.time_format).tolist())]
-        return maintenances
+    def _update_aggregates(self, previous_version):
+        """Apply the changed order cells to the order views which were up to
+        date before the orders changed"""
+        deltas, self._order_deltas = self._order_deltas, []
+        if len(deltas) > 0:
+            deltas = [np.concatenate(d) for d in zip(*deltas)]
+        for key, aggregate in list(self._aggregates.items()):
+            orders_version, *others = aggregate.versions
+            if aggregate.updatable and orders_version == previous_version:
+                if len(deltas) > 0:
+                    aggregate = aggregate.apply(*deltas)
+                aggregate.versions = (self.versions['orders'], *others)
+                self._aggregates[key] = aggregate
+
+    def _drop_aggregates(self):
+        """Forget the order views after the axes of the order cube changed"""
+        self._aggregates.clear()
+        self._order_deltas = []
+
+    def _update_next_maintenance(self, form_mask=None):
+        """(Re-)calculate the next maintenance dates for the given forms.
+
+        :param form_mask: boolean array over unique_forms. All forms if None.
+        """
+        if form_mask is None:
+            form_mask = np.ones(len(self.bedarf_formen), dtype=bool)
+        bedarf = self.bedarf_formen.loc[form_mask, :]
+        duration_left = bedarf['Anzahl maximaler Gießvorgänge'] - \
+                        bedarf['Anzahl bisheriger Gießvorgänge']
+        start = self.months.searchsorted(self.today)
+        if 'next maintenance' not in self.bedarf_formen:
+            self.bedarf_formen['next maintenance'] = \
+                pd.PeriodIndex([pd.NaT] * len(self.bedarf_formen), freq='M')
+        if start == len(self.months):
+            # no planned orders from today on
+            self.bedarf_formen.loc[form_mask, 'next maintenance'] = pd.NaT
+            return
+        self.bedarf_formen.loc[form_mask, 'next maintenance'] = \
+            self._next_maintenance(self._form_attrition[start:, form_mask],
+                                   duration_left.values, self.months[start:])
+
+    @staticmethod
+    def _next_maintenance(next_attritions, duration_left, months):
+        """Months the forms reach their EOL in
+
+        :param next_attritions: month x form array of upcoming attritions
+        :param duration_left: array over forms of the remaining casts
+        :param months: pd.PeriodIndex of the upcoming months
+        """
+        maintenance = (next_attritions.cumsum(axis=0) -
+                       duration_left[np.newaxis, :]) < 0
+        next_maintenance = maintenance.sum(axis=0)
+        return months[next_maintenance.clip(max=len(maintenance) - 1)]
+
+    @cached('orders', 'forms')
+    @cached('orders', 'forms')
+    def maintenance_plan(self, crew_capacity=None):
+        """Maintenance windows of all forms reaching their EOL within the
+        planned orders, see utils.maintenance.plan_maintenance_windows.
+
+        :param crew_capacity: forms maintained per window,
+        maintenance_crew_capacity if None
+        :return: pd.DataFrame indexed by the forms to maintain, sorted by
+        window, with the columns 'window' and 'EOL' (months) and 'wasted
+        life' (fraction of the tool life)
+        :raises utils.maintenance.MaintenanceInfeasible: if the crew can not
+        maintain all forms due
+        """
+        start = self.months.searchsorted(self.today)
+        wear = self.form_attritions_over_time.iloc[start:, :]
+        shots_max = self.bedarf_formen['Anzahl maximaler Gießvorgänge'].values
+        shots_left = shots_max - \
+            self.bedarf_formen['Anzahl bisheriger Gießvorgänge'].values
+        windows, eol, waste = plan_maintenance_windows(
+            wear.values, shots_left, shots_max,
+            crew_capacity or self.maintenance_crew_capacity)
+        planned = windows >= 0
+        return pd.DataFrame({'window': wear.index[windows[planned]],
+                             'EOL': wear.index[eol[planned]],
+                             'wasted life': waste[planned]},
+                            index=wear.columns[planned].rename('Form')) \
+            .sort_values(['window', 'EOL'], kind='stable')
+
+    @property
+    @cached('orders', 'forms')
+    def form_status(self):
+        """EOL status of all forms, computed in one pass.
+
+        :return: pd.DataFrame indexed by form with columns 'next maintenance'
+        (month or NaT), 'months to EOL' (float, NaN if no maintenance is
+        due) and 'criticality' (0: critical, 1: near critical,
+        2: uncritical)
+        """
+        status = self.bedarf_formen.set_index('Form') \
+            .loc[:, ['next maintenance']]
+        if self.criticality_quantile is not None:
+            status['next maintenance'] = self.eol_forecast(
+                quantiles=(self.criticality_quantile,)).iloc[:, 0]
+        next_maintenance = pd.PeriodIndex(status['next maintenance'],
+                                          freq='M')
+        months_to_eol = np.where(next_maintenance.isna(), np.nan,
+                                 next_maintenance.asi8 - self.today.ordinal)
+        status['months to EOL'] = months_to_eol
+        status['criticality'] = np.searchsorted(
+            self.criticality_months,
+            np.nan_to_num(months_to_eol, nan=np.inf), side='right')
+        return status
 
     def next_maintenance(self, _form):
-        return self.bedarf_formen.loc[self.bedarf_formen.Form == _form,
-                                      'next maintenance'].values[0]
+        return self.form_status.at[_form, 'next maintenance']
+
+    @cached('orders', 'forms')
+    def eol_forecast(self, quantiles=(0.1, 0.5, 0.9), n_paths=None, seed=0):
+        """Probabilistic EOL forecast of all forms.
+
+        Order trajectories are simulated from the planned orders, varied and
+        cancelled at the rates observed in the order history before today,
+        and pushed through prod_form_map.
+
+        :param quantiles: quantiles of the EOL distribution
+        :param n_paths: amount of simulated trajectories, eol_paths if None
+        :param seed: seed of the simulation
+        :return: pd.DataFrame indexed by form with one column of months per
+        quantile, e.g. 'P10'. NaT if the EOL is beyond the planned months.
+        """
+        quantiles = sorted(quantiles)
+        start = self.months.searchsorted(self.today)
+        product_orders = self.orders.sum(axis=0, dtype=np.int64)
+        cancellation_rate, cv2 = order_variability(product_orders[:, :start])
+        mean, var = form_attrition_moments(product_orders[:, start:].T,
+                                           self.prod_form_map.values,
+                                           cancellation_rate, cv2)
+        duration_left = \
+            self.bedarf_formen['Anzahl maximaler Gießvorgänge'].values - \
+            self.bedarf_formen['Anzahl bisheriger Gießvorgänge'].values
+        counts = forecast_eol(mean, var, duration_left,
+                              n_paths=n_paths or self.eol_paths,
+                              n_jobs=self.eol_jobs, seed=seed)
+        offsets = eol_quantiles(counts, quantiles)
+        future_months = self.months[start:]
+        return pd.DataFrame(
+            {f'P{round(q * 100)}': pd.PeriodIndex(
+                [future_months[o] if o < len(future_months) else pd.NaT
+                 for o in offsets[:, i]], freq='M')
+             for i, q in enumerate(quantiles)},
+            index=pd.Index(self.unique_forms, name='Form'))
 
     def maintenance_of_form_within_months(self, form, months=3):
-        """Check if form is due within given months"""
-        next_maintenance = pd.to_datetime(self.next_maintenance(form),
-                                          format=self.time_format)
-        return ((next_maintenance -
-                 pd.to_datetime('today'))/np.timedelta64(1, 'M')) < months
+        """Check if form is due within given months, i.e. within the current
+        month and the (months - 1) following ones"""
+        next_maintenance = self.next_maintenance(form)
+        if pd.isna(next_maintenance):
+            return False
+        return next_maintenance.ordinal - self.today.ordinal < months
 
     def form_is_critical(self, form):
-        if self.maintenance_of_form_within_months(form, 3):
-            color_idx = 0
-        elif self.maintenance_of_form_within_months(form, 6):
-            color_idx = 1
-        else:
-            color_idx = 2
-        return color_idx
-
-    def orders_over_time(self, customers=(1, 2)):
-        """Get a nicely sorted df of orders summed over customers"""
-
-        today = self.today
-        cust_key = '_'.join(str(c) for c in customers)
-        _cached_orders = self.cache.get(today, None)
-        if _cached_orders is not None:
-            _cached_orders_for_customers = _cached_orders.get(cust_key, None)
-            if _cached_orders_for_customers is not None:
-                return _cached_orders_for_customers
-        else:
-            self.cache[today] = {}
-        # no cache available
-        ret = (self.orders_df
-               .loc[self.orders_df.Kunde.isin(customers), :]
-               .drop(['Kunde', 'total_attrition'], axis=1)
-               .groupby(['Produktnummer', 'date']).sum()  # sum over customers
-               .reset_index()
-               .pivot(index='date', columns='Produktnummer',
-                      values='amt_orders')
-               .assign(date_dt=lambda x: pd.to_datetime(x.index,
-                                                        format=self.time_format))
-               .sort_values(by=['date_dt']).drop('date_dt', axis=1)
-               .loc[self.today:, :])
-        self.cache[today][cust_key] = ret
-        return ret
-
-    def giesszellenbedarf_over_time(self, customers=(1, 2)):
+        return self.form_status.at[form, 'criticality']
+
+    def orders_over_time(self, customers=(1, 2), forecast=False):
+        """Get a nicely sorted df of orders summed over customers
+
+        :param forecast: whether planned orders are complemented by the
+        demand forecast, see _upcoming_orders
+        """
+        return self.order_aggregate(customers, forecast).orders_frame
+
+    def giesszellenbedarf_over_time(self, customers=(1, 2), forecast=False):
         """Get a nicely sorted df of giesszellenbedarf over time summed over
         customers"""
-        orders_over_time = self.orders_over_time(customers)
-        prod_giess = self.prod_giesszellenbedarf_map.sum(axis=1)
-        return prod_giess * orders_over_time
+        return self.order_aggregate(customers, forecast).giess_frame
+
+    def order_aggregate(self, customers=(1, 2), forecast=False):
+        """Materialized view of the upcoming orders and casting cell demand
+        of a customer set, shared by all charts of that set. Views without
+        forecast are kept up to date by the changed order cells, views with
+        forecast are rebuilt after changes.
+
+        :param customers: customer or list of customers
+        :param forecast: whether planned orders are complemented by the
+        demand forecast, see _upcoming_orders
+        :return: OrderAggregate
+        """
+        if not isinstance(customers, (list, tuple, set, np.ndarray,
+                                      pd.Index)):
+            customers = [customers]
+        forecast = bool(forecast) and self.demand_model is not None
+        ci = self._axis_positions(self.customers, list(customers))
+        key = (tuple(ci), forecast)
+        versions = (self.versions['orders'], self.versions['forms'],
+                    self.versions['forecast'] if forecast else None,
+                    self.today)
+        aggregate = self._aggregates.get(key)
+        if aggregate is not None and aggregate.versions == versions:
+            return aggregate
+        if aggregate is not None and \
+                aggregate.versions[0] == versions[0] and \
+                aggregate.versions[2:] == versions[2:]:
+            # only the forms changed
+            aggregate = aggregate.reweight(self._giess_per_product)
+        else:
+            orders, months = self._upcoming_orders(ci, forecast)
+            start = None if forecast else self.months.searchsorted(
+                self.today)
+            aggregate = OrderAggregate(
+                ci, orders.sum(axis=0, dtype=orders.dtype if forecast
+                               else np.int64).T,
+                months, self.products, self._giess_per_product, start)
+        aggregate.versions = versions
+        # views built during a mutation of another thread might miss
+        #  changed cells, they are not kept
+        if self.lock.acquire(blocking=False):
+            try:
+                if versions[0] == self.versions['orders']:
+                    self._aggregates[key] = aggregate
+                    self._aggregates.move_to_end(key)
+                    if len(self._aggregates) > self.max_aggregates:
+                        self._aggregates.popitem(last=False)
+            finally:
+                self.lock.release()
+        return aggregate
+
+    @property
+    def _giess_per_product(self):
+        return self.prod_giesszellenbedarf_map.sum(axis=1).values
+
+    def _upcoming_orders(self, ci, forecast=False):
+        """Orders from today on as customer x product x month array.
+
+        With forecast, the horizon spans at least forecast_months and the
+        demand forecast fills in all cells without planned orders. Planned
+        orders are never overridden by the forecast.
+
+        :param ci: customer positions
+        :param forecast: whether to complement the planned orders by the
+        demand forecast. Ignored as long as no demand model is trained.
+        :return: tuple (array, pd.PeriodIndex of its months)
+        """
+        start = self.months.searchsorted(self.today)
+        orders, months = self.orders[ci, :, start:], self.months[start:]
+        model = self.demand_model
+        if not forecast or model is None:
+            return orders, months
+        all_months = months.union(pd.period_range(
+            self.today, periods=self.forecast_months, freq='M')).rename('date')
+        planned = np.zeros((len(ci), len(self.products), len(all_months)))
+        planned[:, :, all_months.get_indexer(months)] = orders
+        predicted = model.predict(all_months, self.customers[ci],
+                                  self.products)
+        return np.where(planned > 0, planned, predicted), all_months
+
+    def train_demand_models(self):
+        """Fit the demand models to the order history before today in a
+        background job, which spreads the work over a process pool.
+        Returns immediately. Models of an unchanged history are loaded from
+        the model cache.
+
+        :return: job id of the training
+        """
+        with self.lock:
+            if self.training_demand_models:
+                return self._training
+            start = self.months.searchsorted(self.today)
+            self._training = self.jobs.submit(
+                'Bedarfsprognose', self._train_demand_models,
+                np.array(self.orders[:, :, :start]), self.months[:start],
+                self.customers, self.products)
+        return self._training
+
+    @property
+    def training_demand_models(self):
+        return self._training is not None and \
+            self.jobs.is_active(self._training)
+
+    def _train_demand_models(self, *args, progress=None):
+        model = self.forecaster.train(*args)
+        with self.lock:
+            self.demand_model = model
+            self._touch('forecast')
+
+    def capacity_plan(self, capacity=None):
+        """Production plan of the upcoming orders of all customers under a
+        casting cell capacity, see utils.planning.plan_production. Forms are
+        down for maintenance_months from their EOL on, products can not be
+        cast while one of their forms is down.
+
+        The plan is computed by a background job and cached per data
+        version.
+
+        :param capacity: casting cell capacity per month, a scalar or one
+        value per upcoming month. casting_cell_capacity if None.
+        :return: tuple (ProductionPlan or None while it is computed or if
+        it failed, job id of the planning or None if the plan was cached)
+        """
+        if capacity is None:
+            capacity = self.casting_cell_capacity
+        capacity = tuple(np.atleast_1d(capacity).astype(np.float64).tolist())
+        key = ('capacity_plan', self.today, self.versions['orders'],
+               self.versions['forms'], capacity)
+        plan = self.cache.get(key)
+        if plan is not None:
+            return plan, None
+        with self.lock:
+            job_id = self._planning.get(key)
+            status = None if job_id is None else self.jobs.status(job_id)
+            if status is not None and status['status'] == 'failed':
+                # the failure is reported once, the next request plans anew
+                del self._planning[key]
+                return None, job_id
+            # a finished plan may have aged out of the cache
+            if status is None or status['status'] == 'done':
+                # plans of outdated data are not of interest anymore
+                self._planning = {k: j for k, j in self._planning.items()
+                                  if k[:4] == key[:4]}
+                aggregate = self.order_aggregate(self.customers)
+                job_id = self.jobs.submit(
+                    'Kapazitätsplanung', self._plan_capacity, key, aggregate,
+                    self.prod_form_map.fillna(0),
+                    self._eol_positions(aggregate.months), capacity)
+                self._planning[key] = job_id
+        return None, job_id
+
+    def _eol_positions(self, months):
+        """Positions of the forms' EOL among the given months, -1 for forms
+        outlasting the planned orders"""
+        start = self.months.searchsorted(self.today)
+        duration_left = (self.bedarf_formen['Anzahl maximaler Gießvorgänge'] -
+                         self.bedarf_formen['Anzahl bisheriger Gießvorgänge'])
+        reached = self._form_attrition[start:].sum(axis=0) >= \
+            duration_left.values
+        positions = months.get_indexer(pd.PeriodIndex(
+            self.bedarf_formen['next maintenance'], freq='M'))
+        return np.where(reached, positions, -1)
+
+    def _plan_capacity(self, key, aggregate, prod_form_map, eol_positions,
+                       capacity, progress=None):
+        months, products = aggregate.months, aggregate.products
+        downtime = maintenance_downtime(eol_positions, len(months),
+                                        self.maintenance_months)
+        capacity = np.broadcast_to(capacity, (len(months),))
+        cast, late, unmet = plan_production(
+            aggregate.orders, aggregate.giess_per_product, capacity,
+            product_availability(downtime, prod_form_map.values))
+        plan = ProductionPlan(
+            schedule=pd.DataFrame(cast, index=months, columns=products),
+            late=pd.DataFrame(late, index=months, columns=products),
+            unmet=pd.Series(unmet, index=products),
+            load=pd.Series(cast.dot(aggregate.giess_per_product),
+                           index=months),
+            late_load=pd.Series(late.dot(aggregate.giess_per_product),
+                                index=months),
+            demand=pd.Series(aggregate.giess.sum(axis=1), index=months),
+            capacity=pd.Series(capacity, index=months),
+            downtime=pd.DataFrame(downtime, index=months,
+                                  columns=prod_form_map.columns))
+        self.cache.put(key, plan)
+        return plan
+
+    @cached('orders', 'forms')
+    def evaluate_scenario(self, scenario):
+        """Upcoming orders, casting cell demand, form attritions and EOL of
+        all customers under a what-if scenario.
+
+        The scenario is a sparse overlay on the order cube, which is shared
+        with all other scenarios and never altered. Only the changed cells'
+        deltas are propagated to the upcoming month x product orders and
+        from there to the form attritions. Changes of months before today
+        only alter the order history and have no effect here.
+
+        :param scenario: utils.scenario.Scenario
+        :return: ScenarioResult
+        """
+        blocks = []
+        for change in scenario.changes:
+            in_range = (self.months >= pd.Period(change.start, freq='M')) & \
+                (self.months <= pd.Period(change.end, freq='M'))
+            blocks.append((
+                self._axis_positions(self.customers, list(change.customers)),
+                self._axis_positions(self.products, list(change.products)),
+                np.flatnonzero(in_range)))
+        cells, delta = overlay_cells(
+            self.orders, blocks, [c.factor for c in scenario.changes],
+            [c.amt for c in scenario.changes])
+        _, pi, mi = np.unravel_index(cells, self.orders.shape)
+        start = self.months.searchsorted(self.today)
+        upcoming = mi >= start
+        base = self.order_aggregate(self.customers)
+        orders = base.orders.astype(np.float64)
+        np.add.at(orders, (mi[upcoming] - start, pi[upcoming]),
+                  delta[upcoming])
+        form_attrition = self._form_attrition[start:] + \
+            (orders - base.orders).dot(self.prod_form_map.values)
+        duration_left = \
+            (self.bedarf_formen['Anzahl maximaler Gießvorgänge'] -
+             self.bedarf_formen['Anzahl bisheriger Gießvorgänge']).values
+        months = self.months[start:]
+        if len(months) > 0:
+            next_maintenance = self._next_maintenance(
+                form_attrition, duration_left, months)
+        else:
+            next_maintenance = pd.PeriodIndex([pd.NaT] * len(duration_left),
+                                              freq='M')
+        return ScenarioResult(
+            orders=pd.DataFrame(orders, index=months, columns=self.products),
+            giess=pd.DataFrame(orders * base.giess_per_product, index=months,
+                               columns=self.products),
+            form_attrition=pd.DataFrame(form_attrition, index=months,
+                                        columns=self.unique_forms),
+            next_maintenance=pd.Series(next_maintenance,
+                                       index=self.unique_forms),
+            changed_cells=int((delta != 0).sum()))
 
     def update_orders(self, customers, products, date, amt):
-        """Update orders_df with what was specified by the user and
-        submitted through the update button"""
-
-        if date not in self.orders_df.date.tolist():
-            # add new date
-            self.orders_df = \
-                pd.concat([self.orders_df] +
-                          [pd.DataFrame(
-                              {'Kunde': k,
-                               'Produktnummer':
-                                   self.orders_df.Produktnummer.unique().tolist(),
-                               'date': date,
-                               'amt_orders': 0}) for k in customers],
-                          ignore_index=True, sort=False)
-        mask = (self.orders_df.Kunde.isin(customers) &
-                self.orders_df.Produktnummer.isin(products) &
-                self.orders_df.date.isin([date]))
-        assert len(self.orders_df.loc[mask, :]) > 0, 'filter error'
-        self.orders_df.loc[mask, 'amt_orders'] += amt
+        """Update the order cube with what was specified by the user and
+        submitted through the update button.
+
+        Only the touched (customer, product, month) cells are altered: the
+        month's row of the form attritions and the EOL of those forms the
+        given products actually wear out. No full recalculation of the
+        additional features takes place."""
+
+        with self._mutation():
+            date = pd.Period(date, freq='M')
+            self._add_months([date])
+            ci = self._axis_positions(self.customers, customers)
+            pi = self._axis_positions(self.products, products)
+            mi = self.months.get_loc(date)
+            assert len(ci) > 0 and len(pi) > 0, 'filter error'
+            cells = np.ix_(ci, pi, [mi])
+            old_amt = self.orders[cells].astype(np.int64)
+            # avoid negative orders
+            new_amt = (old_amt + amt).clip(min=0)
+            self.orders[cells] = new_amt
+            customer_idx, product_idx = np.meshgrid(ci, pi, indexing='ij')
+            self._order_deltas.append(
+                (customer_idx.ravel(), product_idx.ravel(),
+                 np.full(customer_idx.size, mi),
+                 (new_amt - old_amt)[:, :, 0].ravel()))
+            self._apply_order_deltas(np.full(len(pi), mi), pi,
+                                     (new_amt - old_amt).sum(axis=(0, 2)))
+            self._log_change(dict(op='update',
+                                  customers=self.customers[ci].tolist(),
+                                  products=self.products[pi].tolist(),
+                                  date=str(date), amt=int(amt)))
+
+    def ingest_orders(self, records, mode='add'):
+        """Upsert many order records at once, keyed on their customer,
+        product and month. The form attritions and next maintenance dates
+        are refreshed only once for all records.
+
+        :param records: pd.DataFrame with the columns Kunde, Produktnummer,
+        date and amt, or an iterable of (customer, product, month, amt)
+        tuples. Months must be convertible to pd.Period.
+        :param mode: 'add' to add amt to the existing orders (negative for
+        cancellations), 'set' to overwrite existing orders with amt
+        :return: IngestReport with the amount of inserted, updated and
+        clamped (would have become negative) customer-product-month cells
+        """
+        if not isinstance(records, pd.DataFrame):
+            records = pd.DataFrame(list(records),
+                                   columns=['Kunde', 'Produktnummer', 'date',
+                                            'amt'])
+        with self._mutation():
+            report, changes = self._upsert_orders(records, mode)
+            self._refresh_features(changes)
+            if self.store is not None and not self._replaying:
+                if len(records) > self.max_logged_records:
+                    self.compact()
+                else:
+                    records = records.loc[:, ['Kunde', 'Produktnummer',
+                                              'date', 'amt']]
+                    self._log_change(dict(
+                        op='ingest', mode=mode,
+                        records=[[int(c), int(p), str(pd.Period(d, 'M')),
+                                  int(a)] for c, p, d, a in
+                                 records.itertuples(index=False)]))
+        return report
+
+    def _upsert_orders(self, records, mode, axes=None):
+        """Write order records into the order cube without refreshing the
+        additional features.
+
+        :param records: pd.DataFrame with the columns Kunde, Produktnummer,
+        date and amt
+        :param mode: 'add' or 'set', see ingest_orders
+        :param axes: tuple of the month and customer axes the cells are
+        reported as inserted or updated against, e.g. the axes before the
+        first chunk of an upload. The current axes if None.
+        :return: IngestReport and the changes to refresh the features with,
+        i.e. a (month, product position, order delta) tuple of arrays
+        """
+        if mode not in ('add', 'set'):
+            raise ValueError(f'Unknown ingestion mode {mode}!')
+        if len(records) == 0:
+            return IngestReport(0, 0, 0), self._no_changes()
+        self._check_records(records)
+        months = pd.PeriodIndex(records.date, freq='M')
+        known_months, known_customers = axes or (self.months, self.customers)
+        existed = (known_months.get_indexer(months) >= 0) & \
+                  (known_customers.get_indexer(records.Kunde) >= 0)
+        self._add_months(months)
+        self._add_customers(records.Kunde.unique())
+        cells = np.ravel_multi_index(
+            (self.customers.get_indexer(records.Kunde),
+             self.products.get_indexer(records.Produktnummer),
+             self.months.get_indexer(months)), self.orders.shape)
+        amt = records.amt.values.astype(np.int64)
+
+        # one value per cell
+        if mode == 'add':
+            cells, first, inverse = np.unique(cells, return_index=True,
+                                              return_inverse=True)
+            amt_per_cell = np.zeros(len(cells), dtype=np.int64)
+            np.add.at(amt_per_cell, inverse.ravel(), amt)
+            amt = amt_per_cell
+        else:
+            # the last record of a cell wins
+            cells, first = np.unique(cells[::-1], return_index=True)
+            first = len(amt) - 1 - first
+            amt = amt[first]
+        existed = existed[first]
+
+        old_amt = np.take(self.orders, cells).astype(np.int64)
+        new_amt = old_amt + amt if mode == 'add' else amt
+        clamped = new_amt < 0
         # avoid negative orders
-        self.orders_df.amt_orders = self.orders_df.amt_orders.clip(lower=0)
-        # recalculate additional features
-        self.calculate_additional_features()
+        new_amt = new_amt.clip(min=0)
+        np.put(self.orders, cells, new_amt)
+        ci, pi, mi = np.unravel_index(cells, self.orders.shape)
+        if self._aggregates:
+            # only kept for order views to update
+            self._order_deltas.append((ci, pi, mi, new_amt - old_amt))
+        report = IngestReport(inserted=int((~existed).sum()),
+                              updated=int(existed.sum()),
+                              clamped=int(clamped.sum()))
+        return report, self._merge_changes(
+            (self.months[mi], pi, new_amt - old_amt))
+
+    def _check_records(self, records):
+        """Raise a ValueError if order records can not be ingested
+
+        :param records: pd.DataFrame with the columns Kunde, Produktnummer,
+        date and amt
+        """
+        unknown_products = ~records.Produktnummer.isin(self.products)
+        if unknown_products.any():
+            raise ValueError('Unknown products: ' + ', '.join(
+                str(p) for p in
+                records.Produktnummer[unknown_products].unique()))
+
+    def _no_changes(self):
+        return self.months[:0], np.zeros(0, dtype=int), np.zeros(0)
+
+    def _merge_changes(self, *changes):
+        """Sum up order changes per month and product"""
+        n_products = len(self.products)
+        months = self.months[:0].append([c[0] for c in changes])
+        keys = months.asi8 * n_products + \
+               np.concatenate([c[1] for c in changes])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        delta = np.zeros(len(keys))
+        np.add.at(delta, inverse.ravel(),
+                  np.concatenate([c[2] for c in changes]))
+        return pd.PeriodIndex.from_ordinals(keys // n_products, freq='M'), \
+               keys % n_products, delta
+
+    def _refresh_features(self, *changes):
+        """Refresh the form attritions and next maintenance dates after
+        order changes as returned by _upsert_orders"""
+        if self._form_attrition is None:
+            # additional features are not calculated yet
+            return
+        months = self.months[:0].append([c[0] for c in changes])
+        self._apply_order_deltas(self.months.get_indexer(months),
+                                 np.concatenate([c[1] for c in changes]),
+                                 np.concatenate([c[2] for c in changes]))
+
+    def _apply_order_deltas(self, month_idx, product_idx, delta):
+        """Propagate changed order amounts to the form attritions and next
+        maintenance dates.
+
+        :param month_idx: positions on the month axis
+        :param product_idx: positions on the product axis
+        :param delta: order deltas aligned with month_idx and product_idx
+        """
+        changed = delta != 0
+        if not changed.any():
+            return
+        month_idx, product_idx = month_idx[changed], product_idx[changed]
+        delta_per_month_x_prod = np.zeros((len(self.months),
+                                           len(self.products)))
+        np.add.at(delta_per_month_x_prod, (month_idx, product_idx),
+                  delta[changed])
+        months = np.unique(month_idx)
+        self._form_attrition[months, :] += \
+            delta_per_month_x_prod[months, :].dot(self.prod_form_map.values)
+        # only forms worn out by the altered products get a new EOL
+        prod_forms = self.prod_form_map.values[np.unique(product_idx), :]
+        self._update_next_maintenance((prod_forms != 0).any(axis=0))
+        self._touch('orders')
 
     def parse_upload(self, contents, filename, last_mod):
         """Parse the given file and check for sanity"""
-        content_type, content_string = contents.split(',')
+        return self.parse_uploads([contents], [filename])
 
-        decoded = base64.b64decode(content_string)
+    def parse_uploads(self, contents, filenames, progress=None):
+        """Parse several uploaded files, check them for sanity and ingest
+        all of them at once. Files are streamed in chunks, which are all
+        validated before any is ingested, such that a faulty upload leaves
+        the data untouched. The additional features are refreshed once at
+        the end.
 
-        if filename.endswith('.csv'):
-            # Assume that the user uploaded a CSV file
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-        elif filename.endswith(('.xls', '.xlsx')):
-            # Assume that the user uploaded an excel file
-            df = pd.read_excel(io.BytesIO(decoded))
-        else:
-            raise ValueError('Wrong file extension!')
-        df = df.reset_index(drop=True).dropna().astype(np.uint32)
-        self.orders_df = pd.concat([self.orders_df,
-                                    self._prettify_orders(df)],
-                                   ignore_index=True, sort=False)
-        # remove redundant entries
-        #  There can be only unique customer-product-date triplets
-        #  Keeping the last entry, which is the newly uploaded one
-        self.orders_df = self.orders_df.drop_duplicates(subset=[
-            'Produktnummer', 'date', 'Kunde'], keep='last').reset_index(
-            drop=True)
+        :param contents: list of base64 encoded file contents as given by
+        the dash upload component
+        :param filenames: list of the corresponding file names
+        :param progress: callable taking the fraction of the files ingested
+        so far and a message, e.g. of a background job
+        :return: IngestReport
+        """
+        def file_progress(i, name, phase, offset):
+            if progress is None:
+                return None
+            return lambda f: progress(
+                (offset + (i + f) / len(contents)) / 2,
+                f'{name}: {phase} {f:.0%}')
+
+        # validate all files before changing anything, such that an upload
+        #  is either ingested completely or not at all
+        for i, (content, filename) in enumerate(zip(contents, filenames)):
+            for chunk in read_order_chunks(
+                    content, filename, self.upload_chunksize,
+                    progress=file_progress(i, filename, 'geprüft', 0)):
+                self._check_records(self._melt_orders(chunk))
+
+        with self._mutation():
+            reports, changes = [IngestReport(0, 0, 0)], [self._no_changes()]
+            # cells are inserted or updated with regard to the data before
+            #  the upload, no matter which chunk added their month first
+            axes = self.months, self.customers
+            # the order views are rebuilt from the cube on demand, instead
+            #  of keeping the changed cells of all chunks to update them
+            self._drop_aggregates()
+            for i, (content, filename) in enumerate(zip(contents,
+                                                        filenames)):
+                for chunk in read_order_chunks(
+                        content, filename, self.upload_chunksize,
+                        progress=file_progress(i, filename, 'übernommen', 1)):
+                    # There can be only unique customer-product-date
+                    #  triplets. The newly uploaded entries overwrite
+                    #  existing ones
+                    report, change = self._upsert_orders(
+                        self._melt_orders(chunk), mode='set', axes=axes)
+                    reports.append(report)
+                    changes = [self._merge_changes(*changes, change)]
+            self._refresh_features(*changes)
+            if self.store is not None:
+                self.compact()
+        return IngestReport(*np.sum(reports, axis=0).tolist())
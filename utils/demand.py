@@ -0,0 +1,170 @@
+import hashlib
+import os
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+from utils.parallel import process_pool
+
+
+class SeasonalDemandModel:
+    """Seasonal baseline demand model for many (customer, product) order
+    series at once.
+
+    A series' forecast is its recent level, i.e. its mean over the last
+    level_months, scaled by the seasonal index of the calendar month, i.e.
+    its mean in that calendar month relative to its overall mean."""
+
+    def __init__(self, level_months=12):
+        self.level_months = level_months
+        self.customers, self.products = None, None
+        self.level, self.seasonal = None, None
+
+    def fit(self, history, months, customers, products):
+        """Fit all series of the order history.
+
+        :param history: customer x product x month array of past orders
+        :param months: pd.PeriodIndex of the history's months
+        :param customers: pd.Index of the history's customers
+        :param products: pd.Index of the history's products
+        :return: self
+        """
+        self.customers, self.products = customers, products
+        self.level, self.seasonal = fit_seasonal_baseline(
+            history.reshape(-1, history.shape[-1]), months,
+            self.level_months)
+        return self
+
+    def predict(self, months, customers=None, products=None):
+        """Forecast the orders of the given months.
+
+        :param months: pd.PeriodIndex
+        :param customers: pd.Index, the fitted customers if None. Customers
+        unknown to the model get no orders
+        :param products: pd.Index, the fitted products if None
+        :return: customer x product x month array of forecasted orders
+        """
+        calendar_months = np.asarray(months.month) - 1
+        forecast = (self.level[:, np.newaxis] *
+                    self.seasonal[:, calendar_months]) \
+            .reshape(len(self.customers), len(self.products), len(months))
+        for axis, fitted, keys in ((0, self.customers, customers),
+                                   (1, self.products, products)):
+            if keys is None:
+                continue
+            positions = fitted.get_indexer(keys)
+            known = positions >= 0
+            shape = list(forecast.shape)
+            shape[axis] = len(positions)
+            selected = np.zeros(shape)
+            index = [slice(None)] * 3
+            index[axis] = known
+            selected[tuple(index)] = forecast.take(positions[known],
+                                                   axis=axis)
+            forecast = selected
+        return forecast
+
+    def to_arrays(self):
+        return dict(customers=self.customers.values,
+                    products=self.products.values, level=self.level,
+                    seasonal=self.seasonal)
+
+    @classmethod
+    def from_arrays(cls, arrays, **kwargs):
+        model = cls(**kwargs)
+        model.customers = pd.Index(arrays['customers'], name='Kunde')
+        model.products = pd.Index(arrays['products'], name='Produktnummer')
+        model.level, model.seasonal = arrays['level'], arrays['seasonal']
+        return model
+
+
+def fit_seasonal_baseline(history, months, level_months=12):
+    """Fit the seasonal baseline of many series, vectorized over series.
+
+    :param history: series x month array
+    :param months: pd.PeriodIndex of the history's months
+    :return: tuple of arrays (level over series, series x 12 seasonal
+    indices)
+    """
+    history = np.asarray(history, dtype=np.float64)
+    n_series = history.shape[0]
+    level = history[:, -level_months:].mean(axis=1) if history.shape[1] \
+        else np.zeros(n_series)
+    calendar_months = np.asarray(months.month) - 1
+    sums = np.zeros((n_series, 12))
+    np.add.at(sums.T, calendar_months, history.T)
+    counts = np.bincount(calendar_months, minlength=12)
+    overall_mean = history.mean(axis=1, keepdims=True) if history.shape[1] \
+        else np.zeros((n_series, 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        seasonal = sums / counts / overall_mean
+    # calendar months without history or series without orders
+    seasonal[~np.isfinite(seasonal)] = 1.
+    return level, seasonal
+
+
+class DemandForecaster:
+    """Trains seasonal demand models on a process pool and caches the fitted
+    models on disk, keyed by the order history they were fitted to."""
+
+    def __init__(self, model_path=None, n_jobs=None, chunk_size=2000,
+                 level_months=12):
+        """
+        :param model_path: directory of the model cache, no caching if None
+        :param n_jobs: worker processes, all cores if None
+        :param chunk_size: series per worker task
+        """
+        self.model_path = model_path
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.level_months = level_months
+        if model_path is not None:
+            os.makedirs(model_path, exist_ok=True)
+
+    def _cache_file(self, history, months, customers, products):
+        key = hashlib.sha1()
+        for a in (history, months.asi8, customers.values, products.values,
+                  np.array([self.level_months])):
+            key.update(np.ascontiguousarray(a).tobytes())
+        return join(self.model_path, f'demand-{key.hexdigest()}.npz')
+
+    def load(self, history, months, customers, products):
+        """Cached model of this history or None"""
+        if self.model_path is None:
+            return None
+        path = self._cache_file(history, months, customers, products)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            return SeasonalDemandModel.from_arrays(
+                arrays, level_months=self.level_months)
+
+    def train(self, history, months, customers, products):
+        """Fit the models of all (customer, product) series, chunks of
+        series in parallel, and cache them on disk.
+
+        :return: SeasonalDemandModel
+        """
+        model = self.load(history, months, customers, products)
+        if model is not None:
+            return model
+        model = SeasonalDemandModel(self.level_months)
+        series = history.reshape(-1, history.shape[-1])
+        chunks = [series[i:i + self.chunk_size]
+                  for i in range(0, len(series), self.chunk_size)]
+        if self.n_jobs > 1 and len(chunks) > 1:
+            with process_pool(min(self.n_jobs, len(chunks))) as pool:
+                fitted = list(pool.map(fit_seasonal_baseline, chunks,
+                                       [months] * len(chunks),
+                                       [self.level_months] * len(chunks)))
+            model.customers, model.products = customers, products
+            model.level = np.concatenate([f[0] for f in fitted])
+            model.seasonal = np.concatenate([f[1] for f in fitted])
+        else:
+            model.fit(history, months, customers, products)
+        if self.model_path is not None:
+            path = self._cache_file(history, months, customers, products)
+            np.savez(path + '.tmp.npz', **model.to_arrays())
+            os.replace(path + '.tmp.npz', path)
+        return model
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def compact(values, digits=4):
+    """Numbers of a figure as short JSON list, rounded to significant
+    digits but not beyond the units, whole numbers as ints. Full float
+    precision is not visible in a chart but takes up to 18 characters per
+    number.
+
+    Order counts and other whole numbers are sent unchanged:
+
+    >>> compact([22497, 0, 123456789])
+    [22497, 0, 123456789]
+    >>> compact([22497.0, 996.3000000000001, 0.000314159])
+    [22497, 996.3, 0.0003142]
+
+    :param values: array-like of numbers, e.g. a 2D array for a nested list
+    :return: list
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.tolist()
+    values = np.nan_to_num(values.astype(np.float64))
+    magnitude = np.floor(np.log10(np.abs(values), where=values != 0,
+                                  out=np.zeros_like(values)))
+    scale = 10 ** np.minimum(magnitude - digits + 1, 0)
+    rounded = np.round(values / scale) * scale
+    whole = rounded == np.round(rounded)
+    if whole.all():
+        return rounded.astype(np.int64).tolist()
+    # shortest representation of the rounded numbers, e.g. 996.3 instead of
+    #  996.3000000000001
+    numbers = [int(v) if is_whole else float(f'{v:.{digits}g}')
+               for v, is_whole in zip(rounded.ravel().tolist(),
+                                      whole.ravel().tolist())]
+    return np.array(numbers, dtype=object).reshape(values.shape).tolist()
+
+
+def category_axis(labels, **axis):
+    """Axis showing the labels at the positions 0, 1, ... Traces on it send
+    no x at all, plotly places their values at these positions by default,
+    such that the labels are sent once per figure instead of once per trace.
+
+    :param labels: list of category labels
+    :param axis: further axis properties
+    :return: axis dict of the figure layout
+    """
+    return dict(axis, tickmode='array', tickvals=list(range(len(labels))),
+                ticktext=list(labels))
+
+
+def top_n(totals, n):
+    """Positions of the n largest positive totals, largest first. A partial
+    sort selects them, such that ranking costs O(len(totals) + n log n).
+
+    :param totals: array of totals, e.g. per product
+    :return: tuple of arrays (positions of the top n; positions of the
+    others)
+    """
+    totals = np.asarray(totals, dtype=np.float64)
+    candidates = np.flatnonzero(totals > 0)
+    if len(candidates) > n:
+        top = candidates[np.argpartition(-totals[candidates], n - 1)[:n]]
+    else:
+        top = candidates
+    top = top[np.argsort(-totals[top], kind='stable')]
+    others = np.ones(len(totals), dtype=bool)
+    others[top] = False
+    return top, np.flatnonzero(others)
@@ -0,0 +1,123 @@
+import numpy as np
+
+from utils.parallel import process_pool
+
+
+def order_variability(history):
+    """Estimate the variability of monthly product orders from the past.
+
+    Months without orders count as cancellations, the spread of the other
+    months as the relative variation of an order.
+
+    :param history: product x month array of past monthly order totals
+    :return: tuple of arrays over products (cancellation rate, squared
+    coefficient of variation of non-cancelled orders)
+    """
+    history = np.asarray(history, dtype=np.float64)
+    ordered = history > 0
+    n_ordered = ordered.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cancellation_rate = np.where(
+            n_ordered > 0, 1 - n_ordered / max(history.shape[1], 1), 0.)
+        mean = np.where(ordered, history, 0).sum(axis=1) / n_ordered
+        var = np.where(ordered, (history - mean[:, np.newaxis])**2,
+                       0).sum(axis=1) / n_ordered
+        cv2 = np.nan_to_num(var / mean**2)
+    return cancellation_rate, cv2
+
+
+def form_attrition_moments(planned, prod_form_map, cancellation_rate, cv2):
+    """Mean and variance of the monthly form attritions, given that each
+    planned product order is cancelled or varies independently.
+
+    :param planned: month x product array of planned order totals
+    :param prod_form_map: product x form array of attritions per product
+    :param cancellation_rate: array over products
+    :param cv2: squared coefficients of variation over products
+    :return: tuple of month x form arrays (mean, variance)
+    """
+    planned = np.asarray(planned, dtype=np.float64)
+    prod_form_map = np.asarray(prod_form_map, dtype=np.float64)
+    keep = 1 - cancellation_rate
+    mean = (planned * keep).dot(prod_form_map)
+    var = (planned**2 * (keep * (1 + cv2) - keep**2)).dot(prod_form_map**2)
+    return mean, var
+
+
+def simulate_eol_counts(mean, var, duration_left, n_paths, seed=None):
+    """Simulate form attrition trajectories and count when forms reach
+    their end of life.
+
+    Monthly form attritions are drawn from log-normal distributions
+    matching the given moments. All forms share the random numbers of a
+    path, which leaves the EOL distribution of each form intact, but saves
+    drawing a random number per form.
+
+    :param mean: month x form array of mean attritions
+    :param var: month x form array of attrition variances
+    :param duration_left: array over forms of the remaining casts
+    :param n_paths: amount of simulated trajectories
+    :param seed: seed of the random number generator
+    :return: form x (months + 1) array counting the paths by the month the
+    form reaches its EOL in. The last column counts the paths the form
+    outlasts all months in.
+    """
+    n_months, n_forms = mean.shape
+    rng = np.random.default_rng(seed)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = np.log1p(np.nan_to_num(var / mean**2))
+        mu = np.log(mean) - sigma2 / 2
+    active = mean > 0
+    mu = np.where(active, mu, -np.inf).astype(np.float32)
+    sigma = np.where(active, np.sqrt(sigma2), 0).astype(np.float32)
+    duration_left = np.asarray(duration_left, dtype=np.float32)
+
+    z = rng.standard_normal((n_months, n_paths, 1), dtype=np.float32)
+    attrition = np.zeros((n_paths, n_forms), dtype=np.float32)
+    eol = np.zeros((n_paths, n_forms), dtype=np.int64)
+    x = np.empty((n_paths, n_forms), dtype=np.float32)
+    for m in range(n_months):
+        np.multiply(z[m], sigma[m], out=x)
+        x += mu[m]
+        attrition += np.exp(x, out=x)
+        # months before the EOL
+        eol += attrition < duration_left
+    return np.bincount((eol + np.arange(n_forms) * (n_months + 1)).ravel(),
+                       minlength=n_forms * (n_months + 1)) \
+        .reshape(n_forms, n_months + 1)
+
+
+def eol_quantiles(counts, quantiles=(0.1, 0.5, 0.9)):
+    """Quantiles of the EOL distribution from simulated counts.
+
+    :param counts: form x (months + 1) array, see simulate_eol_counts
+    :return: form x quantile array of month offsets, the amount of months
+    stands for EOLs beyond the last month
+    """
+    cdf = counts.cumsum(axis=1) / counts.sum(axis=1, keepdims=True)
+    return np.stack([(cdf < q).sum(axis=1) for q in quantiles], axis=1)
+
+
+def forecast_eol(mean, var, duration_left, n_paths=10000, batch_size=1000,
+                 n_jobs=1, seed=None):
+    """Monte Carlo EOL forecast of forms.
+
+    The paths are simulated in batches to bound memory usage. With n_jobs
+    greater than one, the batches are spread over a process pool. The
+    result does not depend on n_jobs for a given seed.
+
+    :return: form x (months + 1) array of EOL counts, see
+    simulate_eol_counts
+    """
+    n_batches = -(-n_paths // batch_size)
+    sizes = [batch_size] * (n_batches - 1) + \
+            [n_paths - batch_size * (n_batches - 1)]
+    seeds = np.random.SeedSequence(seed).spawn(n_batches)
+    args = [(mean, var, duration_left, size, batch_seed)
+            for size, batch_seed in zip(sizes, seeds)]
+    if n_jobs > 1:
+        with process_pool(n_jobs) as pool:
+            counts = list(pool.map(simulate_eol_counts, *zip(*args)))
+    else:
+        counts = [simulate_eol_counts(*a) for a in args]
+    return np.sum(counts, axis=0)
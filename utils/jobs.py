@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+
+class JobRunner:
+    """Local background job runner, such that long-running work like uploads
+    or model training does not hold the request threads of the app.
+
+    Jobs run on a thread pool, as they mutate the state of this process'
+    DataManager. The NumPy and pandas heavy lifting releases the GIL most
+    of the time. Jobs report their progress, which is kept in a job table.
+    With a path, the job table is an SQLite database, such that the status
+    of a job can be polled from every worker process of the app.
+    """
+
+    max_jobs = 100  # finished jobs kept in the job table
+
+    def __init__(self, max_workers=2, path=None):
+        """
+        :param max_workers: amount of jobs running at the same time
+        :param path: directory of the shared job table, only this process
+        knows its jobs if None
+        """
+        self._executor = ThreadPoolExecutor(max_workers,
+                                            thread_name_prefix='job')
+        self._jobs = {}  # job id -> status dict
+        self._lock = threading.Lock()
+        self.path = path
+        self._conn, self._conn_pid = None, None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            with self._lock:
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, '
+                    'name TEXT, status TEXT, progress REAL, message TEXT, '
+                    'updated REAL)')
+
+    @property
+    def _connection(self):
+        """SQLite connection of this process, must be used with the lock"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(join(self.path, 'jobs.sqlite'),
+                                         timeout=60, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def submit(self, name, func, *args, **kwargs):
+        """Run func(*args, progress=..., **kwargs) in the background.
+
+        func is passed a progress callback taking the fraction of work done
+        and an optional message.
+
+        :param name: name of the job shown to the user, e.g. 'Upload'
+        :return: job id
+        """
+        job_id = uuid.uuid4().hex
+        self._update(job_id, name=name, status='pending', progress=0.,
+                     message='')
+
+        def progress(fraction, message=None):
+            self._update(job_id, progress=float(fraction),
+                         **({} if message is None else dict(message=message)))
+
+        def run():
+            self._update(job_id, status='running')
+            try:
+                result = func(*args, progress=progress, **kwargs)
+            except Exception as e:
+                traceback.print_exc()
+                self._update(job_id, status='failed', message=str(e))
+                raise
+            self._update(job_id, status='done', progress=1.)
+            return result
+
+        future = self._executor.submit(run)
+        with self._lock:
+            self._jobs[job_id]['future'] = future
+        return job_id
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.setdefault(job_id, dict(id=job_id))
+            job.update(fields, updated=time.time())
+            if self.path is not None:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO jobs (id, name, status, progress, '
+                    'message, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                    tuple(job[k] for k in ('id', 'name', 'status', 'progress',
+                                           'message', 'updated')))
+            if fields.get('status') in ('done', 'failed'):
+                self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        finished = sorted((job['updated'], job_id) for job_id, job in
+                          self._jobs.items()
+                          if job['status'] in ('done', 'failed'))
+        for _, job_id in finished[:-self.max_jobs]:
+            del self._jobs[job_id]
+        if self.path is not None:
+            self._connection.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND id "
+                "NOT IN (SELECT id FROM jobs WHERE status IN "
+                "('done', 'failed') ORDER BY updated DESC LIMIT ?)",
+                (self.max_jobs,))
+
+    def status(self, job_id):
+        """Status of a job as dict with the keys id, name, status ('pending',
+        'running', 'done' or 'failed'), progress (0 to 1), message and
+        updated, or None if the job is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return {k: v for k, v in job.items() if k != 'future'}
+            if self.path is None:
+                return None
+            row = self._connection.execute(
+                'SELECT id, name, status, progress, message, updated FROM '
+                'jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'name', 'status', 'progress', 'message',
+                         'updated'), row))
+
+    def is_active(self, job_id):
+        status = self.status(job_id)
+        return status is not None and status['status'] in ('pending',
+                                                           'running')
+
+    def result(self, job_id, timeout=None):
+        """Wait for a job of this process and return its result"""
+        return self._jobs[job_id]['future'].result(timeout)
@@ -1,14 +1,34 @@
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
-import plotly.graph_objs as go
+import dash
+from dash import Patch
+from dash.dependencies import Input, Output, State, ALL
 import dash_daq as daq
+import pandas as pd
+import numpy as np
 from datetime import date as dt
 
+from utils.cache import cached
+from utils.maintenance import MaintenanceInfeasible
+from utils.figures import category_axis, compact, top_n
+
 
 class LayoutBuilder:
     """Class for building the dashboard layout."""
 
+    time_format = '%b %y'  # how months are displayed
+    orders_page_size = 50  # rows per page of the orders table
+    job_poll_interval = 500  # ms between job status polls
+    # customers whose orders the order and casting cell charts sum up
+    chart_customers = [1]
+    # products shown by the product charts, the others are summed up
+    chart_top_n = 15
+    other_products_label = 'Andere'
+    color_other_products = "#5a6270"
+    # defaults of all bar traces, sent once per figure instead of per trace
+    bar_template = {"data": {"bar": [{
+        "hovertemplate": "%{y}<extra>%{fullData.name}</extra>"}]}}
+
     about = ("""
 ###### Prozesskontrolle für Gießzellen, Gussformen und Produktbestellungen.
 Entwickelt von Wilhelm Kirchgässner für IT-Talents und ZF Friedrichshafen.
@@ -42,13 +62,23 @@ Der Formhaltbarkeit-Überblick zeigt wie weit der Verschleiß für jede Form
 vorangeschritten ist. Die gelbe Sparkline zeigt den zu erwartenden Verschleiß 
 für die nächsten 12 Monate an. EOL (End-of-life) informiert über den Monat der 
 Wartung/Austausch der Form. Ist dieser in den nächsten drei Monaten, so ist 
-dies als kritisch zu bewerten (roter Indikator).
+dies als kritisch zu bewerten (roter Indikator). Darunter steht der Bereich 
+von P10 bis P90 einer Monte-Carlo-Prognose des EOL, die schwankende und 
+stornierte Bestellungen simuliert.
+
+Die nächsten Wartungstermine fassen den Austausch aller Formen, die im 
+Planungszeitraum ihr EOL erreichen, zu möglichst wenigen Wartungsfenstern 
+zusammen. Pro Fenster kann die Wartungscrew nur eine begrenzte Anzahl Formen 
+tauschen. Formen werden dabei möglichst nah an ihrem EOL getauscht, damit 
+wenig Reststandzeit verloren geht.
 
 Die Produkt-Bestellübersicht, sowie die Gießzellenbedarf-Übersicht zeigen auf
 einen Blick wie viel von jedem Produkt bisher bestellt wurde und welchen 
 Gießzellenbedarf sie verursachen, über die nächsten 12 Monate erstreckt.
 Die Kuchendiagramme daneben geben einen Überblick in welchen 
-Mengenverhältnissen die verschiedenen Produkte dabei stehen.
+Mengenverhältnissen die verschiedenen Produkte dabei stehen. Gezeigt werden 
+jeweils die 15 Produkte mit der größten Menge bzw. dem größten 
+Gießzellenbedarf, alle weiteren sind unter "Andere" zusammengefasst.
 
 """)
 
@@ -58,17 +88,38 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
 
         suffix_row = "_row"
         suffix_button_id = "_button"
-        suffix_sparkline_graph = "_sparkline_graph"
         suffix_count = "_count"
-        suffix_gradbar = '_grad_bar'
         suffix_date = '_date'
         suffix_indicator = "_indicator"
-        suffix_is_crit_indicator = '_is_crit_indicator'
-        suffix_eol = '_EOL'
+        # component types of the pattern-matching ids, e.g.
+        #  {'type': 'form-eol', 'index': 'F1'}
+        type_gradbar = 'form-grad-bar'
+        type_sparkline_graph = 'form-sparkline-graph'
+        type_is_crit_indicator = 'form-is-crit-indicator'
+        type_eol = 'form-eol'
+        type_eol_band = 'form-eol-band'
         color_range = ["#FF0000",  # red
                        "#f4d44d",  # yellow
                        "#7ee37b",  # green
                        ]
+        color_pending = "#1e2130"  # indicator until the callback fills it
+        # sparklines are painted empty with their layout, the callback
+        #  only sends their data
+        empty_sparkline = {
+            "data": [],
+            "layout": {
+                "uirevision": True,
+                "margin": dict(l=0, r=0, t=0, b=0, pad=0),
+                "xaxis": dict(showline=False, showgrid=False,
+                              zeroline=False, showticklabels=False),
+                "yaxis": dict(showline=False, showgrid=False,
+                              zeroline=False, showticklabels=False),
+                "paper_bgcolor": "rgba(0,0,0,0)",
+                "plot_bgcolor": "rgba(0,0,0,0)",
+                "template": {"data": {"scatter": [{
+                    "mode": "lines+markers",
+                    "line": {"color": "#f4d44d"}}]}},
+            }}
         grad_bars_max = 15
         attrition_thresh_1 = 0.6
         attrition_thresh_2 = 0.85
@@ -101,9 +152,8 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
             self.app = app
             self.dm = dm
 
-            self.form_attritions_over_time = \
-                self.dm.form_attritions_over_time.loc[self.dm.today:, :]\
-                    .iloc[:13, :]
+        def form_attritions_over_time(self, forecast=False):
+            return self.dm.upcoming_form_attritions(13, forecast)
 
         def _paint_header(self):
             """Builds the form panel header."""
@@ -117,15 +167,18 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                 *div_attrs)
 
         def _paint_body(self):
-            """Builds the form panel body."""
+            """Builds the form panel body. The rows are empty, their contents
+            are filled in by the panel callback."""
             return html.Div(id="metric-rows",
                             children=
-                            [self._paint_row(*self._get_row_contents(f, i))
-                                for i, f in enumerate(self.dm.unique_forms)],
+                            [self._paint_row(*self._get_row_contents(
+                                form, 0, self.empty_sparkline,
+                                self.color_pending, '', ''))
+                                for form in self.dm.unique_forms],
                             )
 
         def paint(self):
-            """Builds and returns the full form panel"""
+            """Builds and returns the skeleton of the form panel"""
             return html.Div(id="metric-div",
                             children=[self._paint_header(),
                                       self._paint_body()],
@@ -148,25 +201,26 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                             style=style,
                             children=[html.Div(**c) for c in new_div_attrs])
 
-        def _get_row_contents(self, item, idx):
+        def _get_row_contents(self, item, gradbar_value, sparkline,
+                              crit_color, eol, eol_band):
             """Build column content.
 
             :param item: e.g. 'F1' or 'F12'
-            :param idx: Counting variable of items
+            :param gradbar_value: number of filled grad bar blocks
+            :param sparkline: figure of the expected attrition
+            :param crit_color: color of the criticality indicator
+            :param eol: EOL label
+            :param eol_band: label of the P10 to P90 range of the EOL
             :return: list of dicts explaining the div attributes
             """
             div_id = item + self.suffix_row
-            gradbar_id = f'F{idx}' + self.suffix_gradbar  # special naming
-            #  cos it is explicitly handled in spc-custom-styles.css
-            sparkline_graph_id = item + self.suffix_sparkline_graph
-            is_crit_id = item + self.suffix_is_crit_indicator
-            eol_id = item + self.suffix_eol
             max_bars = self.grad_bars_max
             div_attrs = [div_id, None,
                 {"id": item, "children": item},  # form nr
-                {"id": gradbar_id + "_container",  # Haltbarkeit
+                {"id": item + "_grad_bar_container",  # Haltbarkeit
                  "children": daq.GraduatedBar(
-                    id=gradbar_id,
+                    id=dict(type=self.type_gradbar, index=item),
+                    className=self.type_gradbar,  # styled by this class
                     showCurrentValue=False, max=max_bars, size=140,
                     color={
                          "ranges": {
@@ -178,103 +232,158 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                                          max_bars],
                          }
                      },
-                    value=max_bars *
-                          self.dm.relative_attritions_per_form[item])
+                    value=gradbar_value)
                 },
                 {"id": item + "_sparkline",  # Erwartete Abnutzung
                  "children": dcc.Graph(
-                    id=sparkline_graph_id,
+                    id=dict(type=self.type_sparkline_graph, index=item),
                     style={"width": "100%", "height": "95%"},
                     config={
                         "staticPlot": False,
                         "editable": False,
                         "displayModeBar": False,
                         },
-                    figure=go.Figure(self._get_sparkline_config(item)),
+                    figure=sparkline,
                         ),
                 },
                 {  # form end of life
-                    'id': eol_id,
-                    'children': self.dm.next_maintenance(item)
+                    'id': item + '_EOL_container',
+                    'children': [
+                        html.Div(id=dict(type=self.type_eol, index=item),
+                                 children=eol),
+                        html.Div(id=dict(type=self.type_eol_band,
+                                         index=item),
+                                 className=self.type_eol_band,
+                                 children=eol_band)]
                 },
                 {  # is form over 80% of its life in the next 3 months?
-                     "id": is_crit_id + '_container',
+                     "id": item + '_is_crit_indicator_container',
                      "children": daq.Indicator(
-                         id=is_crit_id, value=True,
-                         color=self.color_range[self.dm.form_is_critical(item)],
+                         id=dict(type=self.type_is_crit_indicator,
+                                 index=item),
+                         value=True,
+                         color=crit_color,
                          size=12
                      ),
                  },
             ]
             return div_attrs
 
-        def _get_sparkline_config(self, item):
-            """Builds the config for the sparkline graphs item by item"""
-            return {"data": [
-                {
-                    "x": self.form_attritions_over_time.index.values,
-                    "y": self.form_attritions_over_time[item].values,
-                    "mode": "lines+markers",
-                    "name": item,
-                    "line": {"color": "#f4d44d"},
-                }
-            ],
-                "layout": {
-                    "uirevision": True,
-                    "margin": dict(l=0, r=0, t=0, b=0, pad=0),
-                    "xaxis": dict(showline=False,
-                                  showgrid=False,
-                                  zeroline=False,
-                                  showticklabels=False),
-                    "yaxis": dict(showline=False,
-                                  showgrid=False,
-                                  zeroline=False,
-                                  showticklabels=False),
-                    "paper_bgcolor": "rgba(0,0,0,0)",
-                    "plot_bgcolor": "rgba(0,0,0,0)",
-                },
-            }
+        def _sparkline_configs(self, attritions_over_time):
+            """Builds the updates of the sparkline graphs of all forms, i.e.
+            only their data, as their layout is painted with the panel. The
+            13 months shown need no downsampling. Each sparkline is a figure
+            of its own, hence each carries the month labels.
+
+            :param attritions_over_time: month x form pd.DataFrame
+            :return: list of dash.Patch objects
+            """
+            x = attritions_over_time.index.strftime(
+                LayoutBuilder.time_format).tolist()
+            ys = compact(attritions_over_time.values.T)
+            updates = []
+            for item, y in zip(attritions_over_time.columns, ys):
+                update = Patch()
+                update["data"] = [{"x": x, "y": y, "name": item}]
+                updates.append(update)
+            return updates
+
+        def _eol_bands(self, forms):
+            """Labels of the Monte Carlo EOL forecast of the forms, i.e. the
+            range from P10 to P90 and a tooltip with P10, P50 and P90
+
+            :return: tuple of lists (range labels, tooltips)
+            """
+            eol = self.dm.eol_forecast(quantiles=(0.1, 0.5, 0.9)) \
+                .reindex(forms)
+            p10, p50, p90 = (LayoutBuilder.format_months(eol[q])
+                             for q in ('P10', 'P50', 'P90'))
+            # NaT, i.e. '-', if the EOL is beyond the planned months
+            bands = ['' if low == '-' else low if low == high else
+                     f'{low} – {"später" if high == "-" else high}'
+                     for low, high in zip(p10, p90)]
+            tooltips = [f'EOL-Prognose: P10 {low}, P50 {mid}, P90 {high}'
+                        for low, mid, high in zip(p10, p50, p90)]
+            return bands, tooltips
+
+        @cached('orders', 'forms', 'forecast')
+        def _all_panel_contents(self, forecast=False):
+            """Computes the contents of all form rows in one pass.
+
+            :return: tuple of the forms as pd.Index and lists of their grad
+            bar values, sparkline updates, criticality colors, EOL labels,
+            EOL range labels and EOL tooltips
+            """
+            forms = pd.Index(self.dm.unique_forms)
+            attritions = self.dm.relative_attritions_per_form.reindex(forms)
+            attritions_over_time = self.form_attritions_over_time(forecast)
+            status = self.dm.form_status.reindex(forms)
+            return forms, \
+                compact(self.grad_bars_max * attritions.values, 3), \
+                self._sparkline_configs(attritions_over_time[forms]), \
+                np.take(self.color_range, status['criticality']).tolist(), \
+                LayoutBuilder.format_months(status['next maintenance']), \
+                *self._eol_bands(forms)
+
+        def get_panel_contents(self, forms, forecast=False):
+            """Contents of the given form rows.
+
+            :param forms: list of forms in panel order, e.g. ['F1', 'F12']
+            :param forecast: whether the sparklines include the demand
+            forecast
+            :return: tuple of lists (grad bar values, sparkline figure
+            updates, criticality colors, EOL labels, EOL range labels, EOL
+            tooltips), each in order of forms
+            """
+            all_forms, *contents = self._all_panel_contents(forecast)
+            positions = all_forms.get_indexer(list(forms))
+            return tuple([c[i] for i in positions] for c in contents)
 
         def generate_callbacks(self):
             """Infuse panel contents with life. This function makes the
-            content updateable."""
-
-            attritions = self.dm.relative_attritions_per_form
-
-            def create_callback(_form):
-                """Decorator for forms panel callbacks"""
-
-                def callback(_, stored_data):
-                    spark_line = go.Figure(
-                        self._get_sparkline_config(_form))
-                    attrition = attritions[_form]
-                    crit_color = \
-                        self.color_range[self.dm.form_is_critical(_form)]
-                    next_maintenance = self.dm.next_maintenance(_form)
-                    return self.grad_bars_max*attrition, \
-                           spark_line,\
-                           crit_color, \
-                           next_maintenance
-
-                return callback
-
-            for idx, form in enumerate(self.dm.unique_forms):
-                self.app.callback(
-                    output=[
-                        Output(f'F{idx}' + self.suffix_gradbar, "value"),
-                        Output(form + self.suffix_sparkline_graph, "figure"),
-                        Output(form + self.suffix_is_crit_indicator, "color"),
-                        Output(form + self.suffix_eol, 'children')
-                    ],
-                    inputs=[Input("app-tabs", "value")],
-                    state=[State("value-setter-store", "data")],
-                )(create_callback(form))
+            content updateable. A single callback serves all form rows."""
+
+            def callback(_, ai_on, stored_data):
+                # forms in the order of the rows in the layout
+                forms = [o['id']['index'] for o in
+                         dash.callback_context.outputs_list[0]]
+                return self.get_panel_contents(forms, bool(ai_on))
+
+            self.app.callback(
+                output=[
+                    Output(dict(type=self.type_gradbar, index=ALL), "value"),
+                    Output(dict(type=self.type_sparkline_graph, index=ALL),
+                           "figure"),
+                    Output(dict(type=self.type_is_crit_indicator, index=ALL),
+                           "color"),
+                    Output(dict(type=self.type_eol, index=ALL), 'children'),
+                    Output(dict(type=self.type_eol_band, index=ALL),
+                           'children'),
+                    Output(dict(type=self.type_eol_band, index=ALL), 'title')
+                ],
+                inputs=[Input("app-tabs", "value"),
+                        Input("AI-powerbutton", "on")],
+                state=[State("value-setter-store", "data")],
+            )(callback)
 
     def __init__(self, app, dm):
         self.logo = app.get_asset_url("zf_logo.png")
         self.dm = dm
         self.form_artist = self.FormsPanelArtist(app, dm)
 
+    @classmethod
+    def format_month(cls, month):
+        """Renders a pd.Period month as string, e.g. 'Jan 20'"""
+        if month is None or month is pd.NaT:
+            return '-'
+        return month.strftime(cls.time_format)
+
+    @classmethod
+    def format_months(cls, months):
+        """Renders a series of pd.Period months as list of strings"""
+        return pd.PeriodIndex(months, freq='M').strftime(cls.time_format) \
+            .fillna('-').tolist()
+
     @staticmethod
     def build_section_banner(title):
         """Builds a section banner"""
@@ -309,6 +418,20 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                             className="custom-tab",
                             selected_className="custom-tab--selected",
                         ),
+                        dcc.Tab(
+                            id="ML-tab",
+                            label="Bedarfsprognose",
+                            value="tab3",
+                            className="custom-tab",
+                            selected_className="custom-tab--selected",
+                        ),
+                        dcc.Tab(
+                            id="Scenario-tab",
+                            label="Szenarien",
+                            value="tab4",
+                            className="custom-tab",
+                            selected_className="custom-tab--selected",
+                        ),
                     ],
                 )
             ],
@@ -366,17 +489,21 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                         ],
                     ),
                     dcc.Store(id="value-setter-store", data={}),
+                    # whether forecasts are shown, kept across tab switches
+                    dcc.Store(id="ai-store", data=False),
+                    # what-if scenarios as JSON, kept across tab switches
+                    dcc.Store(id="scenario-store", data=[]),
                     self.build_about(),
                 ],
 )
 
-    def build_quick_stats_panel(self):
-        """Quick stats on the left of the view
+    def build_quick_stats_panel(self, forecast=False):
+        """Quick stats on the left of the view. The utilization gauge is
+        filled in by its callback.
 
+        :param forecast: whether the demand forecast is included
         :return: html.Div object
         """
-        current_giesszellenbedarf = \
-            self.dm.giesszellenbedarf_over_time().iloc[0, :]
         return html.Div(
             id="quick-stats",
             className="row",
@@ -410,18 +537,28 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                         html.P("Prozentuale Gießzellenauslastung diesen Monat"),
                         daq.Gauge(id="attrition-gauge",
                                   min=0, max=100, showCurrentValue=True,
-                                  value=100 * current_giesszellenbedarf.mean() /
-                                        current_giesszellenbedarf.max())],
+                                  value=0)],
                 ),
-                html.Div(  # todo: Implement this feature
+                html.Div(
                     id="card-4",
                     children=
-                        daq.BooleanSwitch(id="AI-powerbutton", on=False,
+                        daq.BooleanSwitch(id="AI-powerbutton", on=forecast,
                                         label='AI', color="#92e0d3"),
                 ),
             ],
         )
 
+    @cached('orders', 'forms', 'forecast')
+    def update_auslastung(self, forecast=False):
+        """Percental utilization of the casting cells this month"""
+        current_giesszellenbedarf = self.dm.order_aggregate(
+            forecast=forecast).giess_in(self.dm.today)
+        auslastung = 0  # no orders planned this month
+        if current_giesszellenbedarf.max() > 0:
+            auslastung = 100 * current_giesszellenbedarf.mean() / \
+                         current_giesszellenbedarf.max()
+        return auslastung
+
     def build_banner(self):
         return html.Div(
             id="banner",
@@ -458,7 +595,7 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
         """
         unique_customers = self.dm.unique_customers
         unique_products = self.dm.unique_products
-        orders_df = self.dm.camera_ready_orders
+        rows, page, page_label = self.generate_order_table_content()
         return [
             # Manually select metrics
             html.Div(
@@ -538,6 +675,7 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                             ),
                             html.Br(),
                             dcc.Upload(id='drag-n-drop',
+                                       multiple=True,
                                        children=html.Div([
                                                 'Drag and Drop or ',
                                                 html.A('Select Files')
@@ -551,7 +689,14 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                                            'borderRadius': '5px',
                                            'textAlign': 'center',
                                            'margin': '10px'
-                                       })
+                                       }),
+                            # uploads are ingested by a background job
+                            html.Div(id='upload-progress'),
+                            dcc.Store(id='upload-job'),
+                            dcc.Store(id='upload-done'),
+                            dcc.Interval(id='job-poll',
+                                         interval=self.job_poll_interval,
+                                         disabled=True),
                         ],
                     ),
                     html.Div(
@@ -567,19 +712,48 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                                          html.Tr(
                                              [html.Th('Index')] +
                                              [html.Th(col) for col in
-                                              orders_df.columns]),
+                                              self.dm.order_table_columns]),
                                          ],
                                         id="orders-table-head",
                                         className="output-datatable",),
                             html.Div(
                              html.Table(# body
                                  id='orders-table-content',
-                                 children=self.generate_order_table_content(),
+                                 children=rows,
                                  title='Aktueller Datensatz',
                                  className="output-datatable",
                              ),
                             id="orders-table-body",
                             ),
+                            html.Div(
+                                id="orders-table-pager",
+                                children=[
+                                    dcc.Dropdown(
+                                        id="orders-table-sort",
+                                        options=[{"label": col, "value": col}
+                                                 for col in
+                                                 self.dm.order_table_columns],
+                                        value='Kunde',
+                                        clearable=False,
+                                    ),
+                                    dcc.RadioItems(
+                                        id="orders-table-sort-direction",
+                                        options=[{"label": "aufsteigend",
+                                                  "value": "asc"},
+                                                 {"label": "absteigend",
+                                                  "value": "desc"}],
+                                        value='asc',
+                                    ),
+                                    html.Button("<",
+                                                id="orders-table-prev-btn"),
+                                    html.Span(id="orders-table-page-label",
+                                              children=page_label),
+                                    html.Button(">",
+                                                id="orders-table-next-btn"),
+                                    dcc.Store(id="orders-table-page",
+                                              data=page),
+                                ],
+                            ),
                         ],
                     ),
                 ],
@@ -588,50 +762,289 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
 
     def generate_order_table_content(self,
                                      customers=None, products=None,
-                                     month=None):
-        """Generates the table entries for the data-upload-tab safely
+                                     month=None, sort_by='Kunde',
+                                     ascending=True, page=0):
+        """Generates the table entries of one page for the data-upload-tab
+        safely. Pages beyond the last one show the last one.
 
-        :return: list of html.Div objects
+        :return: tuple of (list of html.Tr objects, page, page label)
         """
-        orders_df = self.dm.camera_ready_orders
-        if customers is not None:
-            if not isinstance(customers, list):
-                customers = [customers]
-            if len(customers) > 0:
-                orders_df = orders_df.loc[orders_df.Kunde.isin(customers), :]
-        if products is not None:
-            if not isinstance(products, list):
-                products = [products]
-            if len(products) > 0:
-                orders_df = orders_df.loc[orders_df.Produkt.isin(products), :]
-        if month is not None:
-            orders_df = orders_df.loc[orders_df.date == month, :]
-
+        page = max(page, 0)
+        orders_df, n_rows = self.dm.query_orders(
+            customers, products, month, sort_by, ascending, page,
+            self.orders_page_size)
+        n_pages = max(-(-n_rows // self.orders_page_size), 1)
+        if page >= n_pages:
+            page = n_pages - 1
+            orders_df, n_rows = self.dm.query_orders(
+                customers, products, month, sort_by, ascending, page,
+                self.orders_page_size)
+        orders_df['date'] = orders_df.date.dt.strftime(self.time_format)
         return [html.Tr([html.Td(i) for i in tup]) for tup in
-                orders_df.itertuples()]
+                orders_df.itertuples()], \
+            page, f'Seite {page + 1} von {n_pages}'
 
-    def build_monitoring_tab(self):
-        """Builds the control-charts-dashboard-tab
+    def build_monitoring_tab(self, forecast=False):
+        """Builds the skeleton of the control-charts-dashboard-tab, which is
+        sent at once. Figures are filled in by the callbacks of the panels,
+        which are triggered by the skeleton's appearance.
 
+        :param forecast: whether the demand forecast is included
         :return: html.Div object
         """
         return html.Div(
                 id="status-container",
                 children=[
-                    self.build_quick_stats_panel(),
+                    self.build_quick_stats_panel(forecast),
                     html.Div(
                         id="graphs-container",
                         children=[self.build_forms_panel(),
                                   self.build_orders_panel(),
-                                  self.build_giesszellenbedarf_panel()
+                                  self.build_giesszellenbedarf_panel(),
+                                  self.build_capacity_panel()
                                   ],
                     ),
                 ],
             )
 
     def build_ml_tab(self):
-        # todo: implement
-        raise NotImplementedError()
+        """Builds the demand-forecast-tab
+
+        :return: html.Div object
+        """
+        return html.Div(
+            id="ml-container",
+            children=[
+                self.build_section_banner("Bedarfsprognose"),
+                html.Div(id="ml-status",
+                         children=self.describe_demand_models()),
+                html.Div(
+                    id="retrain-button-div",
+                    children=html.Button("Neu trainieren",
+                                         id="retrain-btn", n_clicks=0),
+                ),
+                dcc.Graph(id="forecast-chart",
+                          figure=self.update_forecast_chart()),
+            ],
+        )
+
+    def build_scenario_tab(self):
+        """Builds the what-if-scenario-tab, comparing scenarios of changed
+        orders side by side with the current orders
+
+        :return: html.Div object
+        """
+        return html.Div(
+            id="scenario-container",
+            children=[
+                html.Div(
+                    id="scenario-menu",
+                    children=[
+                        html.Label("Szenario"),
+                        dcc.Input(id="scenario-name", type="text",
+                                  value="Szenario 1", debounce=True),
+                        html.Br(),
+                        html.Label("Kunde(n), leer für alle"),
+                        dcc.Dropdown(
+                            id="scenario-customers",
+                            options=[{"label": param, "value": param} for
+                                     param in self.dm.unique_customers],
+                            multi=True,
+                        ),
+                        html.Br(),
+                        html.Label("Produkt(e), leer für alle"),
+                        dcc.Dropdown(
+                            id="scenario-products",
+                            options=[{"label": param, "value": param} for
+                                     param in self.dm.unique_products],
+                            multi=True,
+                        ),
+                        html.Br(),
+                        html.Label("Zeitraum"),
+                        dcc.DatePickerRange(
+                            id="scenario-months",
+                            start_date=dt.today(),
+                            end_date=dt.today(),
+                            display_format='MM/YYYY',
+                        ),
+                        html.Br(),
+                        html.Label("Faktor der Abrufmengen in %"),
+                        daq.NumericInput(id='scenario-factor',
+                                         className='setting-input',
+                                         value=100, min=0, max=10000),
+                        html.Label("Zusätzliche Abrufmenge pro Monat"),
+                        daq.NumericInput(id='scenario-amt',
+                                         className='setting-input',
+                                         value=0, min=-999999,
+                                         max=999999),
+                        html.Br(),
+                        html.Button("Hinzufügen", id="scenario-add-btn"),
+                        html.Button("Alle löschen",
+                                    id="scenario-clear-btn"),
+                        html.Br(),
+                        html.Div(id="scenario-list"),
+                    ],
+                ),
+                html.Div(
+                    id="scenario-comparison",
+                    children=[
+                        self.build_section_banner(
+                            "Gießzellenbedarf im Vergleich"),
+                        self.build_lazy_graph("scenario-giess-chart"),
+                        self.build_section_banner(
+                            "Geändertes Formen-EOL im Vergleich"),
+                        html.Div(id="scenario-eol-table"),
+                    ],
+                ),
+            ],
+        )
+
+    def describe_scenarios(self, scenarios):
+        """One line per change of each scenario"""
+        lines = []
+        for scenario in scenarios:
+            lines.append(html.B(scenario.name))
+            for change in scenario.changes:
+                who = ', '.join(map(str, change.customers)) or 'alle'
+                what = ', '.join(map(str, change.products)) or 'alle'
+                lines.append(html.Div(
+                    f'Kunden {who}, Produkte {what}, '
+                    f'{change.start} bis {change.end}: '
+                    f'{change.factor:.0%} {change.amt:+d}'))
+        return lines
+
+    def update_scenario_chart(self, base, results):
+        """Total casting cell demand per month of the current orders and
+        of each scenario
+
+        :param base: ScenarioResult of the current orders
+        :param results: dict of the ScenarioResults by scenario name
+        """
+        x = base.giess.index.strftime(self.time_format)
+        data = [{"x": x, "y": base.giess.values.sum(axis=1),
+                 "type": "bar", "name": 'Aktuell'}]
+        data += [{"x": x, "y": result.giess.values.sum(axis=1),
+                  "type": "bar", "name": name}
+                 for name, result in results.items()]
+        return {"data": data,
+                "layout": dict(
+                    margin=dict(t=40),
+                    hovermode="closest",
+                    barmode='group',
+                    paper_bgcolor="rgba(0,0,0,0)",
+                    plot_bgcolor="rgba(0,0,0,0)",
+                    legend={"font": {"color": "darkgray"},
+                            "orientation": "h", "x": 0, "y": 1.1},
+                    font={"color": "darkgray"},
+                    showlegend=True,
+                    xaxis={
+                        "zeroline": False,
+                        "showgrid": False,
+                        "title": "Monat und Jahr",
+                        "showline": False,
+                        "titlefont": {"color": "darkgray"},
+                    },
+                    yaxis={
+                        "title": 'Gesamtgießzellenbedarf',
+                        "showgrid": False,
+                        "showline": False,
+                        "zeroline": False,
+                        "autorange": True,
+                        "titlefont": {"color": "darkgray"},
+                    },
+                )}
+
+    def build_scenario_eol_table(self, base, results):
+        """EOL of the forms, whose EOL any scenario changes, under the
+        current orders and under each scenario
+
+        :param base: ScenarioResult of the current orders
+        :param results: dict of the ScenarioResults by scenario name
+        :return: html.Table object
+        """
+        eol = pd.DataFrame({name: result.next_maintenance
+                            for name, result in results.items()})
+        changed = eol.ne(base.next_maintenance, axis=0).any(axis=1)
+        if not changed.any():
+            return html.Div('Kein Szenario ändert das EOL einer Form.')
+        rows = [html.Tr([html.Td(form),
+                         html.Td(self.format_month(base.next_maintenance[
+                             form]))] +
+                        [html.Td(self.format_month(month))
+                         for month in eol.loc[form]])
+                for form in eol.index[changed]]
+        return html.Table(
+            [html.Tr([html.Th('Form'), html.Th('Aktuell')] +
+                     [html.Th(name) for name in eol.columns])] + rows,
+            className="output-datatable")
+
+    def describe_job(self, job_id):
+        """Progress of a background job for the user
+
+        :return: tuple (text, whether the job is finished)
+        """
+        job = self.dm.jobs.status(job_id)
+        if job is None:
+            return 'Unbekannter Auftrag.', True
+        if job['status'] == 'failed':
+            return f"{job['name']} fehlgeschlagen: {job['message']}", True
+        if job['status'] == 'done':
+            return f"{job['name']} abgeschlossen.", True
+        return f"{job['name']} läuft: {job['progress']:.0%} " \
+               f"{job['message']}", False
+
+    def describe_demand_models(self):
+        """Status of the demand models for the user"""
+        model = self.dm.demand_model
+        if self.dm.training_demand_models:
+            return 'Die Prognosemodelle werden im Hintergrund trainiert.'
+        if model is None:
+            return 'Es sind noch keine Prognosemodelle trainiert.'
+        return f'Saisonale Bedarfsprognose für ' \
+               f'{len(model.customers) * len(model.products)} ' \
+               f'Kunde-Produkt-Kombinationen über die nächsten ' \
+               f'{self.dm.forecast_months} Monate. Geplante Bestellungen ' \
+               f'haben Vorrang vor der Prognose.'
+
+    @cached('orders', 'forecast')
+    def update_forecast_chart(self):
+        """Planned orders against orders complemented by the forecast, summed
+        over all customers and products"""
+        customers = self.dm.unique_customers
+        planned = self.dm.orders_over_time(customers).sum(axis=1)
+        forecast = self.dm.orders_over_time(customers, True).sum(axis=1)
+        return {"data": [{"x": df.index.strftime(self.time_format),
+                          "y": df.values,
+                          "type": "bar",
+                          "name": name,
+                          } for name, df in (('Geplant', planned),
+                                             ('Mit Prognose', forecast))],
+                "layout": dict(
+                    margin=dict(t=40),
+                    hovermode="closest",
+                    barmode='group',
+                    paper_bgcolor="rgba(0,0,0,0)",
+                    plot_bgcolor="rgba(0,0,0,0)",
+                    legend={"font": {"color": "darkgray"},
+                            "orientation": "h", "x": 0, "y": 1.1},
+                    font={"color": "darkgray"},
+                    showlegend=True,
+                    xaxis={
+                        "zeroline": False,
+                        "showgrid": False,
+                        "title": "Monat und Jahr",
+                        "showline": False,
+                        "titlefont": {"color": "darkgray"},
+                    },
+                    yaxis={
+                        "title": 'Gesamtbestellmenge',
+                        "showgrid": False,
+                        "showline": False,
+                        "zeroline": False,
+                        "autorange": True,
+                        "titlefont": {"color": "darkgray"},
+                    },
+                )}
 
     def build_forms_panel(self):
         """Builds the top panel giving an overview of all forms and their
@@ -658,15 +1071,44 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                     className="three columns",
                     children=[
                         self.build_section_banner("Nächste Wartungstermine"),
-                        html.Div(id='next_maintenances',
-                                 children=[html.Div(children=m) for m in
-                                           self.dm.maintenances_in_next_months()
-                                           ])
+                        # filled by the callback of the maintenance windows
+                        html.Div(id='next_maintenances'),
                     ],
                 ),
             ],
         )
 
+    @staticmethod
+    def build_lazy_graph(graph_id):
+        """Graph without figure, showing a spinner until its callback has
+        computed the figure"""
+        return dcc.Loading(dcc.Graph(id=graph_id), color="#92e0d3")
+
+    def build_maintenance_windows(self):
+        """Maintenance windows of the forms, each with the forms maintained
+
+        :return: list of html.Div objects
+        """
+        try:
+            plan = self.dm.maintenance_plan()
+        except MaintenanceInfeasible as e:
+            return [html.Div(f'{e.n_forms} fällige Formen können in '
+                             f'{e.n_months} Monaten nicht gewartet werden '
+                             f'(höchstens {e.crew_capacity} Formen pro '
+                             f'Wartungsfenster).')]
+        if len(plan) == 0:
+            return [html.Div('Keine Wartung im Planungszeitraum fällig.')]
+        windows = plan.groupby('window', sort=True)
+        summary = f'{windows.ngroups} Wartungsfenster, ' \
+                  f'{plan["wasted life"].mean():.0%} Reststandzeit ungenutzt'
+        n_late = (plan['window'] > plan['EOL']).sum()
+        if n_late > 0:
+            summary += f', {n_late} Formen erst nach ihrem EOL'
+        return [html.Div(children=f'{self.format_month(window)}: '
+                                  f'{", ".join(forms.index)}')
+                for window, forms in windows] + \
+            [html.Br(), html.Div(summary)]
+
     def build_orders_panel(self):
         """Builds the bar chart for orders
 
@@ -681,16 +1123,14 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                          children=[
                              self.build_section_banner(
                                  "Produkte Bestellübersicht"),
-                             dcc.Graph(id="order-overview",
-                                       figure=self.update_order_chart())
+                             self.build_lazy_graph("order-overview")
                          ]),
                 html.Div(id='order-piechart-container',
                          className='four columns',
                          children=[
                              self.build_section_banner('Bestellverhältnisse '
                                                        'der Produkte'),
-                             dcc.Graph(id="order-piechart",
-                                       figure=self.update_order_pie())
+                             self.build_lazy_graph("order-piechart")
                          ])
             ],
         )
@@ -709,8 +1149,7 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                          children=[
                              self.build_section_banner(
                                  "Gießzellenbedarf Übersicht"),
-                             dcc.Graph(id="giess-overview",
-                                       figure=self.update_giess_chart())
+                             self.build_lazy_graph("giess-overview")
                          ]),
                 html.Div(id='giess-piechart-container',
                          className='four columns',
@@ -718,24 +1157,146 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                              self.build_section_banner(
                                  'Gießzellenauslastungsverhältnis '
                                                        'der Produkte'),
-                             dcc.Graph(id="giess-piechart",
-                                       figure=self.update_giess_pie())
+                             self.build_lazy_graph("giess-piechart")
                          ])
             ],
         )
 
-    def update_order_chart(self, customers=1):
+    def build_capacity_panel(self):
+        """Builds the capacity planning of the casting cells, computed in the
+        background and polled until it is available
+
+        :return: html.Div object
+        """
+        return html.Div(
+            id="capacity-section-container",
+            className="row",
+            children=[
+                self.build_section_banner("Kapazitätsplanung"),
+                html.Div(
+                    id="capacity-settings",
+                    children=[
+                        html.Label("Gießzellenkapazität pro Monat"),
+                        daq.NumericInput(
+                            id='capacity-input',
+                            className='setting-input',
+                            value=self.dm.casting_cell_capacity,
+                            min=0, max=10**9, size=120),
+                        html.Div(id='capacity-status'),
+                        dcc.Interval(id='capacity-poll',
+                                     interval=self.job_poll_interval,
+                                     disabled=True),
+                    ]),
+                self.build_lazy_graph("capacity-chart"),
+            ],
+        )
+
+    def describe_capacity_plan(self, plan):
+        """Summary of a ProductionPlan for the user"""
+        late, unmet = plan.late.values.sum(), plan.unmet.sum()
+        if late == 0 and unmet == 0:
+            return 'Alle Bestellungen können termingerecht gefertigt werden.'
+        return f'{late:.0f} Einheiten werden verspätet gefertigt, ' \
+               f'{unmet:.0f} Einheiten sind im Planungszeitraum nicht ' \
+               f'fertigbar.'
+
+    def update_capacity_chart(self, plan):
+        """Casting cell load of the production plan against the demand of
+        the orders and the capacity"""
+        x = plan.load.index.strftime(self.time_format)
+        in_time_load = plan.load.values - plan.late_load.values
+        return {"data": [{"x": x, "y": in_time_load,
+                          "type": "bar", "name": 'Termingerecht'},
+                         {"x": x, "y": plan.late_load.values,
+                          "type": "bar", "name": 'Verspätet'},
+                         {"x": x, "y": plan.demand.values,
+                          "type": "scatter", "mode": "lines+markers",
+                          "name": 'Bedarf'},
+                         {"x": x, "y": plan.capacity.values,
+                          "type": "scatter", "mode": "lines",
+                          "name": 'Kapazität',
+                          "line": {"dash": "dash", "color": "#f45060"}}],
+                "layout": dict(
+                    margin=dict(t=40),
+                    hovermode="closest",
+                    barmode='stack',
+                    paper_bgcolor="rgba(0,0,0,0)",
+                    plot_bgcolor="rgba(0,0,0,0)",
+                    legend={"font": {"color": "darkgray"},
+                            "orientation": "h", "x": 0, "y": 1.1},
+                    font={"color": "darkgray"},
+                    showlegend=True,
+                    xaxis={
+                        "zeroline": False,
+                        "showgrid": False,
+                        "title": "Monat und Jahr",
+                        "showline": False,
+                        "titlefont": {"color": "darkgray"},
+                    },
+                    yaxis={
+                        "title": 'Gießzellenauslastung',
+                        "showgrid": False,
+                        "showline": False,
+                        "zeroline": False,
+                        "autorange": True,
+                        "titlefont": {"color": "darkgray"},
+                    },
+                )}
+
+    def _stacked_bars(self, values, totals, products):
+        """Bar traces of the chart_top_n products with the largest totals
+        and one of the other products. Months are on a category axis of the
+        layout, see utils.figures.category_axis.
+
+        :param values: month x product array
+        :param totals: totals over products
+        :param products: pd.Index of the products
+        :return: list of traces
+        """
+        top, others = top_n(totals, self.chart_top_n)
+        traces = [{"y": compact(values[:, p]), "type": "bar",
+                   "name": str(products[p])} for p in top]
+        if totals[others].sum() > 0:
+            traces.append({"y": compact(values[:, others].sum(axis=1)),
+                           "type": "bar", "name": self.other_products_label,
+                           "marker": {"color": self.color_other_products}})
+        return traces
+
+    def _pie(self, shares):
+        """Pie trace of the chart_top_n products with the largest shares
+        and one slice of the other products
+
+        :param shares: pd.Series of the shares by product
+        """
+        top, others = top_n(shares.values, self.chart_top_n)
+        labels = shares.index[top].tolist()
+        values = shares.values[top].tolist()
+        colors = ["#f45060" if v > 0.1 else "#91dfd2" for v in values]
+        rest = shares.values[others].sum()
+        if rest > 0:
+            labels.append(self.other_products_label)
+            values.append(rest)
+            colors.append(self.color_other_products)
+        return {
+            "labels": labels,
+            "values": compact(values),
+            "type": "pie",
+            "marker": {"colors": colors,
+                       "line": dict(color="white", width=2)},
+            "hoverinfo": "label",
+            "textinfo": "label",
+        }
+
+    @cached('orders', 'forms', 'forecast')
+    def update_order_chart(self, customers=1, forecast=False):
         """Updates the orders chart"""
         if not isinstance(customers, list):
             customers = [customers]
 
-        orders_df = self.dm.orders_over_time(customers)
-
-        fig = {"data": [{"x": orders_df.index,
-                         "y": orders_df[prod],
-                         "type": "bar",
-                         "name": prod,
-                         } for prod in orders_df],
+        aggregate = self.dm.order_aggregate(customers, forecast)
+        fig = {"data": self._stacked_bars(aggregate.orders,
+                                          aggregate.order_totals,
+                                          aggregate.products),
                "layout": dict(
                    margin=dict(t=40),
                    hovermode="closest",
@@ -746,13 +1307,15 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                            "orientation": "h", "x": 0, "y": 1.1},
                    font={"color": "darkgray"},
                    showlegend=True,
-                   xaxis={
-                       "zeroline": False,
-                       "showgrid": False,
-                       "title": "Monat und Jahr",
-                       "showline": False,
-                       "titlefont": {"color": "darkgray"},
-                   },
+                   template=self.bar_template,
+                   xaxis=category_axis(
+                       aggregate.months.strftime(self.time_format),
+                       zeroline=False,
+                       showgrid=False,
+                       title="Monat und Jahr",
+                       showline=False,
+                       titlefont={"color": "darkgray"},
+                   ),
                    yaxis={
                        "title": 'Gesamtbestellmenge',
                        "showgrid": False,
@@ -766,26 +1329,15 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
 
         return fig
 
-    def update_order_pie(self, customers=1):
+    @cached('orders', 'forms', 'forecast')
+    def update_order_pie(self, customers=1, forecast=False):
         """Updates the orders pie chart"""
         if not isinstance(customers, list):
             customers = [customers]
-        orders_df = self.dm.orders_over_time(customers)
-        values = orders_df.values.sum(axis=0)
-        values = values / values.max()  # normalize
-        colors = ["#f45060" if v > 0.1 else "#91dfd2" for v in values]
+        aggregate = self.dm.order_aggregate(customers, forecast)
         fig = {
-            "data": [
-                {
-                    "labels": orders_df.columns.tolist(),
-                    "values": values,
-                    "type": "pie",
-                    "marker": {"colors": colors,
-                               "line": dict(color="white", width=2)},
-                    "hoverinfo": "label",
-                    "textinfo": "label",
-                }
-            ],
+            "data": [self._pie(pd.Series(aggregate.order_shares,
+                                         index=aggregate.products))],
             "layout": {
                 "margin": dict(t=20, b=50),
                 "uirevision": True,
@@ -798,16 +1350,15 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
         }
         return fig
 
-    def update_giess_chart(self, customers=1):
+    @cached('orders', 'forms', 'forecast')
+    def update_giess_chart(self, customers=1, forecast=False):
         """Updates gie giesszellenbedarf chart"""
         if not isinstance(customers, list):
             customers = [customers]
-        giess_over_time = self.dm.giesszellenbedarf_over_time(customers)
-        return {"data": [{"x": giess_over_time.index,
-                         "y": giess_over_time[prod],
-                         "type": "bar",
-                         "name": prod,
-                         } for prod in giess_over_time],
+        aggregate = self.dm.order_aggregate(customers, forecast)
+        return {"data": self._stacked_bars(aggregate.giess,
+                                           aggregate.giess_totals,
+                                           aggregate.products),
                "layout": dict(
                    margin=dict(t=40),
                    hovermode="closest",
@@ -818,13 +1369,15 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
                            "orientation": "h", "x": 0, "y": 1.1},
                    font={"color": "darkgray"},
                    showlegend=True,
-                   xaxis={
-                       "zeroline": False,
-                       "showgrid": False,
-                       "title": "Monat und Jahr",
-                       "showline": False,
-                       "titlefont": {"color": "darkgray"},
-                   },
+                   template=self.bar_template,
+                   xaxis=category_axis(
+                       aggregate.months.strftime(self.time_format),
+                       zeroline=False,
+                       showgrid=False,
+                       title="Monat und Jahr",
+                       showline=False,
+                       titlefont={"color": "darkgray"},
+                   ),
                    yaxis={
                        "title": 'Gesamtgießzellenbedarf',
                        "showgrid": False,
@@ -836,26 +1389,15 @@ Mengenverhältnissen die verschiedenen Produkte dabei stehen.
 
         )}
 
-    def update_giess_pie(self, customers=1):
+    @cached('orders', 'forms', 'forecast')
+    def update_giess_pie(self, customers=1, forecast=False):
         """Updates the pie chart for giesszellenbedarf"""
         if not isinstance(customers, list):
             customers = [customers]
-        giess_over_time = self.dm.giesszellenbedarf_over_time(customers)
-        values = giess_over_time.values.sum(axis=0)
-        values = values / values.max()  # normalize
-        colors = ["#f45060" if v > 0.1 else "#91dfd2" for v in values]
+        aggregate = self.dm.order_aggregate(customers, forecast)
         fig = {
-            "data": [
-                {
-                    "labels": giess_over_time.columns.tolist(),
-                    "values": values,
-                    "type": "pie",
-                    "marker": {"colors": colors,
-                               "line": dict(color="white", width=2)},
-                    "hoverinfo": "label",
-                    "textinfo": "label",
-                }
-            ],
+            "data": [self._pie(pd.Series(aggregate.giess_shares,
+                                         index=aggregate.products))],
             "layout": {
                 "margin": dict(t=20, b=50),
                 "uirevision": True,
@@ -0,0 +1,158 @@
+import numpy as np
+
+
+class MaintenanceInfeasible(ValueError):
+    """The due forms can not be maintained within the months by the crew
+
+    :param n_forms: amount of forms due for maintenance
+    :param n_months: amount of months planned
+    :param crew_capacity: max. amount of forms maintained per window
+    """
+
+    def __init__(self, n_forms, n_months, crew_capacity):
+        super().__init__(f'{n_forms} forms can not be maintained in '
+                         f'{n_months} months by a crew capacity of '
+                         f'{crew_capacity} forms per window')
+        self.n_forms = n_forms
+        self.n_months = n_months
+        self.crew_capacity = crew_capacity
+
+
+def eol_positions(wear, shots_left):
+    """Month positions forms reach their end of life in.
+
+    :param wear: month x form array of predicted attritions
+    :param shots_left: array over forms of the remaining casts
+    :return: array over forms, -1 for forms outlasting all months
+    """
+    worn_out = np.cumsum(wear, axis=0) >= np.asarray(shots_left)
+    if len(worn_out) == 0:
+        return np.full(worn_out.shape[1], -1)
+    return np.where(worn_out.any(axis=0), worn_out.argmax(axis=0), -1)
+
+
+def plan_maintenance_windows(wear, shots_left, max_shots, crew_capacity):
+    """Group the replacements of worn out forms into maintenance windows.
+
+    Windows are months, in each of which the crew maintains at most
+    crew_capacity forms. In order of priority, the plan minimizes the months
+    forms are maintained after their EOL, the number of windows and the
+    remaining tool life wasted by maintaining forms before their EOL.
+
+    Forms sorted by EOL are maintained in that order first, such that the
+    windows take consecutive groups of forms. A dynamic program over (forms
+    planned, month of the last window) finds the optimal grouping,
+    vectorized over the group sizes and months. As forms wear at different
+    rates, swapping forms between windows or moving them to windows with
+    spare capacity may waste less tool life, which a local search does.
+
+    :param wear: month x form array of predicted attritions
+    :param shots_left: array over forms of the remaining casts
+    :param max_shots: array over forms of the casts of a new form
+    :param crew_capacity: max. amount of forms maintained per window
+    :return: tuple of arrays over forms (window month position, -1 for
+    forms not to be maintained; EOL month position; wasted fraction of the
+    tool life). Without months, no form is maintained.
+    :raises MaintenanceInfeasible: if the crew can not maintain all forms
+    """
+    wear = np.asarray(wear, dtype=np.float64)
+    n_months, n_forms = wear.shape
+    shots_left = np.asarray(shots_left, dtype=np.float64)
+    eol = eol_positions(wear, shots_left)
+    due = np.flatnonzero(eol >= 0)
+    due = due[np.argsort(eol[due], kind='stable')]
+    windows = np.full(n_forms, -1)
+    waste = np.zeros(n_forms)
+    if len(due) == 0:
+        return windows, eol, waste
+
+    # remaining life when maintained at the end of a month, month x form
+    left = (shots_left[due] - np.cumsum(wear[:, due], axis=0)) / \
+        np.asarray(max_shots)[due]
+    months = np.arange(n_months)[:, np.newaxis]
+    months_late = np.clip(months - eol[due], 0, None)
+    # any waste is cheaper than a window, any lateness than all windows
+    window_cost = len(due) + 1.
+    late_cost = window_cost * (n_months + 1)
+    cost = np.where(months_late > 0, late_cost * months_late,
+                    np.clip(left, 0, None))
+    # cost of maintaining forms due[:j] in month m, j x month
+    cum_cost = np.vstack([np.zeros(n_months), np.cumsum(cost.T, axis=0)])
+
+    n_due, capacity = len(due), int(crew_capacity)
+    # best cost of planned forms due[:j] with the last window in month m - 1
+    #  (m = 0: no window yet), and where the last window's group starts
+    best = np.full((n_due + 1, n_months + 1), np.inf)
+    best[0, 0] = 0.
+    group_start = np.zeros((n_due + 1, n_months + 1), dtype=np.int64)
+    for j in range(n_due):
+        if not np.isfinite(best[j]).any():
+            continue
+        # cheapest plan of due[:j] with its last window before each month
+        prefix_best = np.minimum.accumulate(best[j])[:n_months]
+        sizes = np.arange(1, min(capacity, n_due - j) + 1)
+        candidate = prefix_best + window_cost + \
+            cum_cost[j + sizes] - cum_cost[j]
+        target = best[j + sizes, 1:]
+        better = candidate < target
+        target[better] = candidate[better]
+        best[j + sizes, 1:] = target
+        starts = group_start[j + sizes, 1:]
+        starts[better] = j
+        group_start[j + sizes, 1:] = starts
+
+    if not np.isfinite(best[n_due]).any():
+        raise MaintenanceInfeasible(n_due, n_months, capacity)
+    # walk back through the groups
+    j, m = n_due, int(np.argmin(best[n_due]))
+    assigned = np.empty(n_due, dtype=np.int64)
+    while j > 0:
+        start = group_start[j, m]
+        assigned[start:j] = m - 1
+        # the previous plan's last window lies before month m - 1
+        j, m = start, int(np.argmin(best[start, :m]))
+    windows[due] = _improve(assigned, cost.T, capacity, window_cost)
+    planned = windows >= 0
+    worn = np.cumsum(wear, axis=0)
+    waste[planned] = np.clip(
+        (shots_left[planned] - worn[windows[planned], planned]) /
+        np.asarray(max_shots)[planned], 0, None)
+    return windows, eol, waste
+
+
+def _improve(windows, cost, capacity, window_cost, max_rounds=10000):
+    """Local search on a maintenance plan, applying the best swap of two
+    forms' windows or move of a form to a window with spare capacity until
+    neither saves costs.
+
+    :param windows: array over forms of their window months
+    :param cost: form x month array of the costs of maintaining a form
+    :return: improved array of window months
+    """
+    windows = windows.copy()
+    forms = np.arange(len(windows))
+    for _ in range(max_rounds):
+        current = cost[forms, windows]
+        # cost of each form in the window of each other form
+        crossed = cost[:, windows]
+        swap_gain = current[:, np.newaxis] + current - crossed - crossed.T
+        counts = np.bincount(windows, minlength=cost.shape[1])
+        spare = np.flatnonzero((counts > 0) & (counts < capacity))
+        # a form moved out of its window alone saves the window
+        move_gain = (current + window_cost * (counts[windows] == 1))[
+            :, np.newaxis] - cost[:, spare]
+        move_gain[spare == windows[:, np.newaxis]] = -np.inf
+        best_swap = np.unravel_index(np.argmax(swap_gain), swap_gain.shape)
+        best_move = np.unravel_index(np.argmax(move_gain), move_gain.shape) \
+            if len(spare) > 0 else None
+        if best_move is not None and \
+                move_gain[best_move] >= swap_gain[best_swap]:
+            if move_gain[best_move] <= 1e-12:
+                break
+            windows[best_move[0]] = spare[best_move[1]]
+        else:
+            if swap_gain[best_swap] <= 1e-12:
+                break
+            a, b = best_swap
+            windows[a], windows[b] = windows[b], windows[a]
+    return windows
@@ -0,0 +1,181 @@
+import bisect
+import functools
+import threading
+import time
+
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format.
+
+    Recording a value only takes a lock and a few dict updates. Values which
+    are cheap to read off the current state, e.g. cache statistics, are not
+    recorded at all but collected when the metrics are scraped.
+    """
+
+    time_buckets = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5,
+                    5., 10.)
+    byte_buckets = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._metrics = {}  # name -> (type, help, buckets, values by labels)
+        self._collectors = []
+
+    def histogram(self, name, help_text, buckets=time_buckets):
+        self._metrics.setdefault(name, ('histogram', help_text,
+                                        tuple(buckets), {}))
+
+    def counter(self, name, help_text):
+        self._metrics.setdefault(name, ('counter', help_text, None, {}))
+
+    def add_collector(self, collector):
+        """Register a callable returning a list of (name, type, help,
+        labels dict, value) samples, called on every scrape"""
+        self._collectors.append(collector)
+
+    def observe(self, name, value, **labels):
+        """Record a value of a histogram"""
+        _, _, buckets, values = self._metrics[name]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            try:
+                counts = values[key]
+            except KeyError:
+                # bucket counts, then sum and count
+                counts = values[key] = [0] * (len(buckets) + 1) + [0.]
+            counts[bisect.bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def inc(self, name, amount=1, **labels):
+        """Increase a counter"""
+        values = self._metrics[name][3]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values[key] = values.get(key, 0) + amount
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            metrics = [(name, kind, help_text, buckets, dict(values))
+                       for name, (kind, help_text, buckets, values)
+                       in self._metrics.items()]
+        for name, kind, help_text, buckets, values in metrics:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for key, value in sorted(values.items()):
+                labels = dict(key)
+                if kind == 'counter':
+                    lines.append(_sample(name, labels, value))
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(_sample(f'{name}_bucket',
+                                         dict(labels, le=bound), cumulative))
+                lines.append(_sample(f'{name}_sum', labels, value[-1]))
+                lines.append(_sample(f'{name}_count', labels, cumulative))
+        described = set()
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines += [f'# HELP {name} {help_text}',
+                              f'# TYPE {name} {kind}']
+                lines.append(_sample(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _sample(name, labels, value):
+    if not labels:
+        return f'{name} {value}'
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"')
+               .replace('\n', r'\n') for v in labels.values())
+    label_text = ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped))
+    return f'{name}{{{label_text}}} {value}'
+
+
+def instrument_callbacks(app, registry):
+    """Time all callbacks registered so far and record the sizes of their
+    JSON responses, i.e. the figures and tables sent to the browser.
+
+    :param app: dash.Dash
+    :param registry: MetricsRegistry
+    """
+    registry.histogram('dash_callback_seconds', 'Duration of dash callbacks')
+    registry.histogram('dash_callback_response_bytes',
+                       'Size of the JSON responses of dash callbacks',
+                       registry.byte_buckets)
+    registry.counter('dash_callback_errors_total',
+                     'Callbacks raising an exception, incl. PreventUpdate')
+    for callback_id, entry in app.callback_map.items():
+        entry['callback'] = _timed_callback(entry['callback'], callback_id,
+                                            registry)
+
+
+def _timed_callback(func, callback_id, registry):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = func(*args, **kwargs)
+        except Exception:
+            registry.inc('dash_callback_errors_total', callback=callback_id)
+            raise
+        finally:
+            registry.observe('dash_callback_seconds',
+                             time.perf_counter() - start,
+                             callback=callback_id)
+        if isinstance(response, (str, bytes)):
+            registry.observe('dash_callback_response_bytes', len(response),
+                             callback=callback_id)
+        return response
+    return wrapper
+
+
+def instrument_methods(obj, names, registry, metric='method_seconds'):
+    """Time the given methods of an object, e.g. of the DataManager
+
+    :param names: names of the methods
+    :param metric: name of the histogram, labeled by the method name
+    """
+    registry.histogram(metric, f'Duration of {type(obj).__name__} methods')
+    for name in names:
+        method = getattr(obj, name)
+
+        @functools.wraps(method)
+        def wrapper(*args, method=method, name=name, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                registry.observe(metric, time.perf_counter() - start,
+                                 method=name)
+        setattr(obj, name, wrapper)
+
+
+def data_manager_collector(dm):
+    """Collector of the cache statistics, recomputations and memory sizes of
+    a DataManager, see MetricsRegistry.add_collector"""
+    def collect():
+        stats = dm.cache.stats
+        with dm.cache.lock:
+            recomputes = dict(dm.cache.recomputes)
+        samples = [(f'result_cache_{key}_total', 'counter',
+                    f'Result cache {key}', {}, stats[key])
+                   for key in ('hits', 'misses', 'evictions')]
+        samples += [(f'result_cache_{key}', 'gauge',
+                     f'Result cache {key.replace("_", " ")}', {}, stats[key])
+                    for key in ('size', 'hit_rate')]
+        samples += [('result_recomputes_total', 'counter',
+                     'Cached results computed anew', dict(function=name),
+                     count)
+                    for name, count in sorted(recomputes.items())]
+        arrays = dict(orders=dm.orders, form_attrition=dm._form_attrition)
+        samples += [('data_bytes', 'gauge', 'Memory size of the data',
+                     dict(data=name), getattr(array, 'nbytes', 0))
+                    for name, array in arrays.items()]
+        samples.append(('order_aggregates', 'gauge',
+                        'Materialized order views', {},
+                        len(dm._aggregates)))
+        return samples
+    return collect
@@ -0,0 +1,14 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(max_workers):
+    """Pool of worker processes, which are spawned rather than forked. Pools
+    are opened by callbacks and background jobs, i.e. in threads of a server
+    whose locks and connections a fork would copy in whatever state they are.
+
+    :param max_workers: amount of worker processes
+    :return: concurrent.futures.ProcessPoolExecutor
+    """
+    return ProcessPoolExecutor(
+        max_workers, mp_context=multiprocessing.get_context('spawn'))
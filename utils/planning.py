@@ -0,0 +1,100 @@
+import numpy as np
+
+
+def product_availability(downtime, prod_form_map):
+    """Months a product can be cast in, i.e. none of its forms is down for
+    maintenance.
+
+    :param downtime: month x form boolean array of forms under maintenance
+    :param prod_form_map: product x form array of attritions per product
+    :return: month x product boolean array
+    """
+    uses_form = (np.nan_to_num(np.asarray(prod_form_map, dtype=np.float64))
+                 != 0).astype(np.int64)
+    return downtime.astype(np.int64).dot(uses_form.T) == 0
+
+
+def maintenance_downtime(eol_positions, n_months, maintenance_months=1):
+    """Months forms are down for maintenance, starting with their EOL month.
+
+    :param eol_positions: array over forms of the month positions of their
+    EOL, negative for forms without EOL in the horizon
+    :return: month x form boolean array
+    """
+    months = np.arange(n_months)[:, np.newaxis]
+    eol_positions = np.asarray(eol_positions)[np.newaxis, :]
+    return (eol_positions >= 0) & (months >= eol_positions) & \
+        (months < eol_positions + maintenance_months)
+
+
+def plan_production(demand, cell_demand, capacity, available):
+    """Greedy production schedule of ordered products under a monthly
+    casting cell capacity.
+
+    Orders are scheduled backwards from their due month, i.e. each month's
+    free capacity is filled with the outstanding orders due in this month or
+    later, such that products are cast as late as possible without missing
+    their due month. Products with fewer alternative months, e.g. due to the
+    maintenance of their forms, get the capacity first. Orders not fitting
+    before their due month are cast late in the first months with free
+    capacity, the rest is unmet within the horizon.
+
+    :param demand: month x product array of ordered units due per month
+    :param cell_demand: casting cell demand per cast unit over products
+    :param capacity: casting cell capacity over months, or a scalar
+    :param available: month x product boolean array of the months a product
+    can be cast in
+    :return: tuple of month x product arrays (units cast, units of which
+    cast after their due month) and the array of unmet units over products
+    """
+    outstanding = np.array(demand, dtype=np.float64)  # due month x product
+    n_months, n_products = outstanding.shape
+    cell_demand = np.nan_to_num(np.asarray(cell_demand, dtype=np.float64))
+    free = np.broadcast_to(np.asarray(capacity, dtype=np.float64),
+                           (n_months,)).copy()
+    available = np.asarray(available, dtype=bool)
+    # months left to cast a product in when moving backwards
+    alternatives = np.cumsum(available, axis=0) - available
+
+    production = np.zeros((n_months, n_products))
+    for t in range(n_months - 1, -1, -1):
+        wanted = np.where(available[t], outstanding[t:].sum(axis=0), 0)
+        cast = _fill(wanted, cell_demand, free[t], alternatives[t])
+        production[t] = cast
+        free[t] -= cast.dot(cell_demand)
+        _consume(outstanding[t:], cast)
+
+    late = np.zeros((n_months, n_products))
+    for t in range(1, n_months):
+        wanted = np.where(available[t], outstanding[:t].sum(axis=0), 0)
+        if not wanted.any():
+            continue
+        cast = _fill(wanted, cell_demand, free[t], alternatives[t])
+        late[t] = cast
+        free[t] -= cast.dot(cell_demand)
+        _consume(outstanding[:t], cast)
+    return production + late, late, outstanding.sum(axis=0)
+
+
+def _fill(wanted, cell_demand, free, priority):
+    """Units to cast of the wanted units within the free capacity, products
+    with low priority value first. The product exceeding the capacity is cast
+    partially in whole units."""
+    order = np.argsort(priority, kind='stable')
+    costs = (wanted * cell_demand)[order]
+    fits = np.cumsum(costs) <= free + 1e-9
+    cast = np.zeros_like(wanted)
+    cast[order[fits]] = wanted[order[fits]]
+    if not fits.all():
+        first = np.argmin(fits)
+        # the tolerance of fits may leave a slightly negative rest
+        rest = max(free - costs[:first].sum(), 0.)
+        cast[order[first]] = min(np.floor(rest / cell_demand[order[first]]),
+                                 wanted[order[first]])
+    return cast
+
+
+def _consume(outstanding, cast):
+    """Settle outstanding orders by cast units, earliest due month first"""
+    settled = np.clip(np.cumsum(outstanding, axis=0) - cast, 0, None)
+    outstanding[:] = np.diff(settled, axis=0, prepend=0)
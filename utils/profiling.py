@@ -0,0 +1,161 @@
+import cProfile
+import functools
+import io
+import json
+import pathlib
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+
+import flask
+
+
+class StackSampler:
+    """Samples the call stack of a thread in regular intervals, such that
+    the time spent per call path can be rendered as flame graph.
+
+    :param thread_id: ident of the sampled thread
+    :param interval: seconds between two samples
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} '
+                             f'({pathlib.Path(code.co_filename).name}:'
+                             f'{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format of flamegraph.pl and speedscope"""
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in self.stacks.most_common())
+
+
+class CallbackProfiler:
+    """Opt-in profiling of dash callbacks.
+
+    Profiled requests are written to a directory as cProfile stats (.prof),
+    collapsed stacks of a stack sampler (.collapsed) and their metadata
+    (.json). Only the slowest max_profiles requests are kept, such that the
+    directory does not grow while profiling in production.
+
+    :param path: directory of the profiles
+    :param always: profile all callbacks. Otherwise only the callbacks of
+    pages opened with the query flag ?profile, e.g. http://host:8050/?profile
+    :param max_profiles: amount of profiles kept
+    """
+    report_top_n = 20  # slowest profiled callbacks listed in reports
+
+    def __init__(self, path, always=False, max_profiles=50):
+        self.path = pathlib.Path(path)
+        self.always = always
+        self.max_profiles = max_profiles
+        self.lock = threading.Lock()
+
+    def instrument(self, app):
+        """Wrap all callbacks registered so far, incl. the serialization of
+        their responses by dash"""
+        for callback_id, entry in app.callback_map.items():
+            entry['callback'] = self._profiled(entry['callback'],
+                                               callback_id)
+
+    def requested(self):
+        """Whether the current request is to be profiled"""
+        if self.always:
+            return True
+        if not flask.has_request_context() or not flask.request.referrer:
+            return False
+        return 'profile' in parse_qs(urlparse(flask.request.referrer).query,
+                                     keep_blank_values=True)
+
+    def _profiled(self, func, callback_id):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.requested():
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            with StackSampler(threading.get_ident()) as sampler:
+                try:
+                    profile.enable()
+                except ValueError:
+                    # newer Pythons allow one profiler at a time, concurrent
+                    #  requests are sampled only
+                    profile = None
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    if profile is not None:
+                        profile.disable()
+                    duration = time.perf_counter() - start
+                    self._save(callback_id, duration, profile, sampler)
+        return wrapper
+
+    def _save(self, callback_id, duration, profile, sampler):
+        self.path.mkdir(parents=True, exist_ok=True)
+        started = time.time() - duration
+        name = time.strftime('%Y%m%d-%H%M%S', time.localtime(started)) + \
+            f'-{int(started * 1e6) % 10 ** 6:06d}-' + \
+            re.sub(r'[^\w.-]+', '_', callback_id).strip('_.')[:80]
+        if profile is not None:
+            profile.dump_stats(self.path / f'{name}.prof')
+        (self.path / f'{name}.collapsed').write_text(sampler.collapsed())
+        (self.path / f'{name}.json').write_text(json.dumps(dict(
+            name=name, callback=callback_id, seconds=duration,
+            started=started)))
+        with self.lock:
+            for stale in self.slowest()[self.max_profiles:]:
+                for suffix in ('.prof', '.collapsed', '.json'):
+                    (self.path / (stale['name'] + suffix)).unlink(
+                        missing_ok=True)
+
+    def slowest(self, top_n=None):
+        """Metadata of the profiled requests, slowest first, of all workers
+
+        :return: list of dicts with name, callback, seconds and started
+        """
+        profiles = []
+        for meta_path in self.path.glob('*.json'):
+            try:
+                profiles.append(json.loads(meta_path.read_text()))
+            except (OSError, ValueError):
+                continue  # removed or being written by another worker
+        profiles.sort(key=lambda p: p['seconds'], reverse=True)
+        return profiles[:top_n]
+
+    def stats(self, name, top_n=40):
+        """Functions of a profile with the largest cumulative time as text"""
+        out = io.StringIO()
+        pstats.Stats(str(self.path / f'{pathlib.Path(name).name}.prof'),
+                     stream=out).sort_stats('cumulative').print_stats(top_n)
+        return out.getvalue()
+
+    def file(self, filename):
+        """Path of a profile file, None if there is no such file"""
+        path = self.path / pathlib.Path(filename).name
+        return path if path.suffix in ('.prof', '.collapsed') and \
+            path.exists() else None
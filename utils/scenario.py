@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# orders of the given customers and products within the months start to end
+#  are scaled by factor, then amt is added. Empty customers or products stand
+#  for all of them.
+ScenarioChange = namedtuple('ScenarioChange', ['customers', 'products',
+                                               'start', 'end', 'factor',
+                                               'amt'])
+
+
+class Scenario:
+    """What-if scenario, i.e. a named list of order changes overlaid on the
+    order cube without touching it.
+
+    Scenarios are immutable and hashable, such that their evaluations can be
+    cached, and serialize to JSON, such that they can live in the browser
+    instead of the state of a single worker."""
+
+    def __init__(self, name, changes=()):
+        self.name = name
+        self.changes = tuple(ScenarioChange(tuple(c[0]), tuple(c[1]),
+                                            str(c[2]), str(c[3]),
+                                            float(c[4]), int(c[5]))
+                             for c in changes)
+
+    def add(self, customers, products, start, end, factor=1., amt=0):
+        """Scenario with another change on top, see ScenarioChange
+
+        :return: Scenario
+        """
+        return Scenario(self.name, self.changes + (
+            (customers or (), products or (), start, end, factor, amt),))
+
+    def __eq__(self, other):
+        return isinstance(other, Scenario) and \
+            (self.name, self.changes) == (other.name, other.changes)
+
+    def __hash__(self):
+        return hash((self.name, self.changes))
+
+    def __repr__(self):
+        return f'Scenario({self.name!r}, {list(self.changes)!r})'
+
+    def to_json(self):
+        return dict(name=self.name, changes=[list(c) for c in self.changes])
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['name'], data['changes'])
+
+
+def overlay_cells(orders, blocks, factors, amts):
+    """Sparse overlay of order changes on the order cube. Later changes
+    apply on top of earlier ones where they overlap. The cube is only read.
+
+    :param orders: customer x product x month order cube
+    :param blocks: list of (customer, product, month) position arrays, the
+    cells of each change being their cross product
+    :param factors: scale factor of each change
+    :param amts: amount added by each change
+    :return: tuple of arrays (flat cube positions of the changed cells,
+    their order deltas)
+    """
+    cells = np.zeros(0, dtype=np.int64)
+    values = np.zeros(0)
+    for (ci, pi, mi), factor, amt in zip(blocks, factors, amts):
+        block = np.ravel_multi_index(np.ix_(ci, pi, mi), orders.shape).ravel()
+        if len(block) == 0:
+            continue
+        current = np.take(orders, block).astype(np.float64)
+        # cells changed before carry their overlaid values
+        known = np.searchsorted(cells, block).clip(max=max(len(cells) - 1,
+                                                           0))
+        overlaid = (cells[known] == block) if len(cells) > 0 else \
+            np.zeros(len(block), dtype=bool)
+        current[overlaid] = values[known[overlaid]]
+        # avoid negative orders
+        new = np.clip(np.round(current * factor + amt), 0, None)
+        cells, unique = np.unique(np.concatenate([block, cells]),
+                                  return_index=True)
+        values = np.concatenate([new, values])[unique]
+    return cells, values - np.take(orders, cells)
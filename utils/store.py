@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+import sqlite3
+from contextlib import contextmanager
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+
+class SnapshotStore:
+    """Persistent on-disk store of the DataManager state, shared by all
+    worker processes of the app.
+
+    A snapshot holds the order cube, its axes and the derived form attritions
+    as .npy files, which are memory-mapped on load, plus the (small) form
+    master data as CSV. Every mutation is appended to a change log in a
+    SQLite database, which orders the changes of all workers by a sequence
+    number and serializes writers by its write lock. The creation of a
+    snapshot is logged as a change as well, such that workers lagging behind
+    load the snapshot instead of replaying what was compacted into it.
+
+    Layout on disk:
+        <path>/changes.sqlite              change log
+        <path>/snapshot-000000001/*.npy    arrays
+        <path>/snapshot-000000001/*.csv    form master data
+    """
+
+    array_names = ('orders', 'form_attrition', 'customers', 'products',
+                   'months')
+    frame_names = ('bedarf_formen', 'forms_per_prod_df')
+
+    def __init__(self, path, compact_every=200):
+        """
+        :param path: directory of the store, created if not existing
+        :param compact_every: max. amount of change log entries before the
+        store gets compacted into a new snapshot
+        """
+        self.path = path
+        self.compact_every = compact_every
+        os.makedirs(path, exist_ok=True)
+        self._conn, self._conn_pid = None, None
+        self._data_version = None
+        self._transaction_depth = 0
+        with self.transaction():
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS changes '
+                '(seq INTEGER PRIMARY KEY, op TEXT, change TEXT)')
+
+    @property
+    def _connection(self):
+        """SQLite connection of this process. Connections must not be
+        inherited by forked worker processes."""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(join(self.path, 'changes.sqlite'),
+                                         timeout=60, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn_pid = os.getpid()
+            self._transaction_depth = 0
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """Exclusive write transaction. Blocks until all other workers'
+        write transactions are finished. Can be nested."""
+        conn = self._connection
+        if self._transaction_depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        self._transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                conn.execute('ROLLBACK')
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                conn.execute('COMMIT')
+
+    def has_news(self):
+        """Cheap check whether other workers committed changes since the
+        last call"""
+        data_version = self._connection.execute(
+            'PRAGMA data_version').fetchone()[0]
+        has_news = data_version != self._data_version
+        self._data_version = data_version
+        return has_news
+
+    @property
+    def latest_snapshot(self):
+        """(sequence number, name) of the latest snapshot or None"""
+        row = self._connection.execute(
+            "SELECT seq, change FROM changes WHERE op = 'snapshot' "
+            "ORDER BY seq DESC LIMIT 1").fetchone()
+        return None if row is None else (row[0], json.loads(row[1])['name'])
+
+    def has_snapshot(self):
+        return self.latest_snapshot is not None
+
+    def changes_since(self, seq):
+        """List of (sequence number, change) logged after seq"""
+        return [(s, json.loads(c)) for s, c in self._connection.execute(
+            'SELECT seq, change FROM changes WHERE seq > ? ORDER BY seq',
+            (seq,))]
+
+    def append(self, change):
+        """Append a change, i.e. a JSON serializable dict with an 'op' entry,
+        to the change log. Must be called within a transaction.
+
+        :return: sequence number of the change
+        """
+        return self._connection.execute(
+            'INSERT INTO changes (op, change) VALUES (?, ?)',
+            (change['op'], json.dumps(change))).lastrowid
+
+    @property
+    def n_changes(self):
+        """Amount of changes since the latest snapshot"""
+        latest = self.latest_snapshot
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM changes WHERE seq > ?',
+            (0 if latest is None else latest[0],)).fetchone()[0]
+
+    def needs_compaction(self):
+        return self.n_changes >= self.compact_every
+
+    def save_snapshot(self, arrays, frames):
+        """Write a new snapshot and log it. Must be called within a
+        transaction. Changes before the snapshot are removed from the log,
+        snapshots before the previous one are removed from disk.
+
+        :param arrays: dict of np.ndarrays, keys as in array_names
+        :param frames: dict of pd.DataFrames, keys as in frame_names
+        :return: sequence number of the snapshot
+        """
+        previous = self.latest_snapshot
+        seq = self._connection.execute(
+            'SELECT COALESCE(MAX(seq), 0) + 1 FROM changes').fetchone()[0]
+        name = f'snapshot-{seq:09d}'
+        snapshot_dir = join(self.path, name)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        for key in self.array_names:
+            np.save(join(snapshot_dir, key + '.npy'), arrays[key])
+        for key in self.frame_names:
+            frames[key].to_csv(join(snapshot_dir, key + '.csv'), index=False)
+        self._connection.execute(
+            'INSERT INTO changes (seq, op, change) VALUES (?, ?, ?)',
+            (seq, 'snapshot', json.dumps(dict(op='snapshot', name=name))))
+        self._connection.execute('DELETE FROM changes WHERE seq < ?', (seq,))
+        # other workers might still map the previous snapshot
+        keep = {name} if previous is None else {name, previous[1]}
+        for d in os.listdir(self.path):
+            if d.startswith('snapshot-') and d not in keep:
+                shutil.rmtree(join(self.path, d), ignore_errors=True)
+        return seq
+
+    def load_snapshot(self, name):
+        """Load a snapshot. Arrays are memory-mapped copy-on-write, i.e. they
+        can be altered in memory without touching the files.
+
+        :return: tuple of dicts (arrays, frames)
+        """
+        snapshot_dir = join(self.path, name)
+        arrays = {key: np.load(join(snapshot_dir, key + '.npy'),
+                               mmap_mode='c')
+                  for key in self.array_names}
+        frames = {key: pd.read_csv(join(snapshot_dir, key + '.csv'))
+                  for key in self.frame_names}
+        return arrays, frames
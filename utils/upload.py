@@ -0,0 +1,132 @@
+import binascii
+import io
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+month_columns = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug',
+                 'Sep', 'Oct', 'Nov', 'Dec']
+expected_header = 'Kunde,Produktnummer,' + \
+                  ','.join(f'{m}-xx' for m in month_columns) + ',Gesamt'
+
+
+class Base64Reader(io.RawIOBase):
+    """Readable binary stream decoding a base64 string block by block, so
+    the decoded file never has to be held in memory as a whole."""
+
+    def __init__(self, content_string):
+        super().__init__()
+        self._content = content_string
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    @property
+    def fraction_read(self):
+        return self._pos / max(len(self._content), 1)
+
+    def readinto(self, buffer):
+        # 4 base64 characters encode 3 bytes
+        n_chars = max(len(buffer) // 3, 1) * 4
+        block = self._content[self._pos:self._pos + n_chars]
+        self._pos += len(block)
+        decoded = binascii.a2b_base64(block)
+        buffer[:len(decoded)] = decoded
+        return len(decoded)
+
+
+def check_order_header(columns):
+    """Raise a ValueError if the given columns do not comply with the
+    header of order datasets, e.g. Kunde,Produktnummer,Jan-19,...,Dec-19,
+    Gesamt"""
+    columns = [str(c).strip() for c in columns]
+    ok = len(columns) == 15 and columns[:2] == ['Kunde', 'Produktnummer'] \
+        and columns[-1] == 'Gesamt'
+    if ok:
+        years = {c[4:] for c in columns[2:-1]}
+        ok = [c[:4] for c in columns[2:-1]] == [f'{m}-' for m in
+                                                  month_columns] \
+            and len(years) == 1 and years.pop().isdigit()
+    if not ok:
+        raise ValueError('Unexpected header! Expected: ' + expected_header)
+
+
+def read_order_chunks(contents, filename, chunksize=20000, progress=None):
+    """Read an uploaded order dataset chunk by chunk.
+
+    The upload is base64-decoded on the fly and each chunk is validated and
+    cast to uint32 on its own, such that memory usage is bounded by the
+    chunk size rather than by the file size.
+
+    :param contents: base64 encoded file content as given by the dash upload
+    component, e.g. 'data:text/csv;base64,S3VuZGUs...'
+    :param filename: name of the uploaded file, must end with .csv, .xls or
+    .xlsx
+    :param chunksize: max. amount of rows per chunk
+    :param progress: callable called with the fraction of the file read so
+    far after each chunk
+    :return: generator of pd.DataFrames in the original wide format
+    """
+    content_type, content_string = contents.split(',')
+    reader = Base64Reader(content_string)
+    stream = io.BufferedReader(reader)
+    if filename.endswith('.csv'):
+        # Assume that the user uploaded a CSV file
+        #  fixed float dtype as rows with missing entries are dropped later
+        chunks = pd.read_csv(io.TextIOWrapper(stream, encoding='utf-8'),
+                             chunksize=chunksize, dtype=np.float64)
+    elif filename.endswith(('.xls', '.xlsx')):
+        # Assume that the user uploaded an excel file
+        chunks = _read_excel_chunks(stream, filename, chunksize)
+    else:
+        raise ValueError('Wrong file extension!')
+    for chunk in chunks:
+        check_order_header(chunk.columns)
+        chunk.columns = [str(c).strip() for c in chunk.columns]
+        yield chunk.dropna().astype(np.uint32)
+        if progress is not None:
+            progress(reader.fraction_read)
+
+
+def _read_excel_chunks(stream, filename, chunksize, spool_size=2**24):
+    """Read an excel file chunk by chunk. The decoded file is spooled to
+    disk once it exceeds spool_size bytes."""
+    with tempfile.SpooledTemporaryFile(max_size=spool_size) as f:
+        shutil.copyfileobj(stream, f)
+        f.seek(0)
+        try:
+            import openpyxl
+        except ImportError:
+            openpyxl = None
+        if openpyxl is None or filename.endswith('.xls'):
+            # no streaming reader available for this file
+            yield _stringify_month_columns(pd.read_excel(f))
+            return
+        workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows)
+            batch, n_chunks = [], 0
+            for row in rows:
+                batch.append(row)
+                if len(batch) == chunksize:
+                    yield _stringify_month_columns(
+                        pd.DataFrame(batch, columns=header))
+                    batch, n_chunks = [], n_chunks + 1
+            if len(batch) > 0 or n_chunks == 0:
+                yield _stringify_month_columns(
+                    pd.DataFrame(batch, columns=header))
+        finally:
+            workbook.close()
+
+
+def _stringify_month_columns(df):
+    """Excel tends to turn month headers into dates. Convert them back."""
+    df.columns = [c.strftime('%b-%y') if isinstance(c, datetime) else c
+                  for c in df.columns]
+    return df